@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from create_test_structure import generate_tree
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+MODES = ["empty", "temp", "dups", "same", "attrib", "rename", "all"]
+
+# Runs clean_files.main() in the child process and writes its resource usage to the file
+# named in CLEAN_FILES_BENCH_OUT when the run ends.
+RUNNER = """
+import json, os, resource, runpy, sys, atexit
+def report():
+    # ru_maxrss survives exec and may include the parent's footprint; prefer VmHWM.
+    usage = {"max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    usage["max_rss_kb"] = int(line.split()[1])
+        with open("/proc/self/io") as f:
+            for line in f:
+                key, value = line.split(":")
+                usage[key] = int(value)
+    except OSError:
+        pass
+    with open(os.environ["CLEAN_FILES_BENCH_OUT"], "w") as f:
+        json.dump(usage, f)
+atexit.register(report)
+sys.path.insert(0, sys.argv[1])
+sys.argv = [os.path.join(sys.argv[1], "clean_files.py")] + sys.argv[2:]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def run_mode(mode, tree_args, extra_args, work_dir):
+    """Generates a fresh tree, runs one mode on it non-interactively and returns its metrics."""
+    tree = os.path.join(work_dir, "tree")
+    shutil.rmtree(tree, ignore_errors=True)
+    tree_stats = generate_tree(tree, **tree_args)
+    out_path = os.path.join(work_dir, "usage.json")
+    stats_path = os.path.join(work_dir, "stats.json")
+    env = dict(os.environ, CLEAN_FILES_BENCH_OUT=out_path)
+    cmd = [sys.executable, "-c", RUNNER, SRC_DIR, mode, tree, "--yes", "--stats", "json", "--stats-file", stats_path] + extra_args
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=work_dir, env=env, stdout=subprocess.DEVNULL, check=True)
+    elapsed = time.perf_counter() - start
+    with open(out_path) as f:
+        usage = json.load(f)
+    with open(stats_path) as f:
+        stats = json.load(f)
+    bytes_hashed = stats["total"]["counters"].get("bytes_read", 0)
+    return {
+        "files": tree_stats["files"],
+        "seconds": round(elapsed, 4),
+        "files_per_s": round(tree_stats["files"] / elapsed, 1),
+        "bytes_read": usage.get("rchar"),
+        "bytes_read_per_s": round(usage["rchar"] / elapsed, 1) if "rchar" in usage else None,
+        "bytes_hashed": bytes_hashed,
+        "bytes_hashed_per_s": round(bytes_hashed / elapsed, 1),
+        # Only read and write calls; stat, open and getdents are not counted by /proc/self/io.
+        "io_calls": usage["syscr"] + usage["syscw"] if "syscr" in usage else None,
+        "max_rss_kb": usage["max_rss_kb"],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Prints the change against the baseline and returns the list of regressions."""
+    regressions = []
+    for mode, result in results.items():
+        base = baseline.get(mode)
+        if not base:
+            continue
+        for key, higher_is_better in (("files_per_s", True), ("bytes_hashed_per_s", True), ("max_rss_kb", False),
+                                      ("io_calls", False)):
+            if not base.get(key) or result.get(key) is None:
+                continue
+            change = (result[key] - base[key]) / base[key]
+            worse = -change if higher_is_better else change
+            marker = ""
+            if worse > tolerance:
+                marker = "  REGRESSION"
+                regressions.append((mode, key))
+            print("  %-7s %-18s %12s -> %12s (%+.1f%%)%s" % (mode, key, base[key], result[key], change * 100, marker))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks clean_files.py on generated trees.")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes to run (default: all modes)")
+    parser.add_argument("--files", type=int, default=20000, help="Files per generated tree (default: 20000)")
+    parser.add_argument("--depth", type=int, default=3, help="Directory tree depth (default: 3)")
+    parser.add_argument("--fanout", type=int, default=4, help="Subdirectories per directory (default: 4)")
+    parser.add_argument("--size-median", type=int, default=4096, help="Median file size in bytes (default: 4096)")
+    parser.add_argument("--dup-ratio", type=float, default=0.1, help="Fraction of duplicate files (default: 0.1)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--baseline", default="bench_baseline.json", help="Baseline JSON file (default: bench_baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (default: 0.2)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args, extra_args = parser.parse_known_args()
+
+    tree_args = {"files": args.files, "depth": args.depth, "fanout": args.fanout,
+                 "size_median": args.size_median, "dup_ratio": args.dup_ratio, "seed": args.seed}
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="clean_files_bench_")
+    try:
+        for mode in args.modes.split(","):
+            results[mode] = run_mode(mode, tree_args, extra_args, work_dir)
+            r = results[mode]
+            print("%-7s %8.3fs %10.1f files/s %14s bytes read %14s bytes hashed %12.1f bytes hashed/s"
+                  " %10s read/write calls %8d KiB RSS" % (
+                      mode, r["seconds"], r["files_per_s"], r["bytes_read"], r["bytes_hashed"],
+                      r["bytes_hashed_per_s"], r["io_calls"], r["max_rss_kb"]))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Baseline saved to:", args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("\nComparison with", args.baseline)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
+import argparse
 import os
+import random
 import time
 
 
@@ -75,5 +77,108 @@ def create_test_structure(base_dir="test_dir"):
     print("Test directory structure created in:", os.path.abspath(base_dir))
 
 
+def generate_tree(base_dir="test_dir", files=1000, depth=3, fanout=4, size_median=4096, size_sigma=2.0,
+                  max_size=16777216, dup_ratio=0.1, same_ratio=0.05, temp_ratio=0.05, empty_ratio=0.02,
+                  bad_perm_ratio=0.05, bad_name_ratio=0.02, seed=0):
+    """
+    Generates a synthetic tree of arbitrary size for testing and benchmarking the cleaning script.
+
+    Directories form a tree 'depth' levels deep with 'fanout' subdirectories per level; files
+    are spread over all directories. File sizes follow a log-normal distribution around
+    'size_median' (capped at 'max_size'). Each ratio is the fraction of files that are made
+    duplicates of an earlier file, reuse the name of an earlier file in another directory,
+    get a temporary extension, are empty, get 0777 permissions, or contain problematic
+    characters in their name. The same seed always produces the same tree.
+
+    Returns a dict with the number of files and bytes written and the count per category.
+    """
+    rng = random.Random(seed)
+    dirs = [base_dir]
+    level = [base_dir]
+    for d in range(depth):
+        level = [os.path.join(parent, "d%d_%d" % (d, i)) for parent in level for i in range(fanout)]
+        dirs.extend(level)
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+
+    stats = {"files": 0, "bytes": 0, "duplicate": 0, "same": 0, "temp": 0, "empty": 0,
+             "bad_perm": 0, "bad_name": 0}
+    contents = []
+    names = []
+    for i in range(files):
+        directory = rng.choice(dirs)
+        name = "file_%d.dat" % i
+        r = rng.random()
+        if r < empty_ratio:
+            data = b""
+            stats["empty"] += 1
+        elif r < empty_ratio + dup_ratio and contents:
+            data = rng.choice(contents)
+            stats["duplicate"] += 1
+        else:
+            size = min(max_size, max(1, int(rng.lognormvariate(0, size_sigma) * size_median)))
+            data = rng.randbytes(size)
+            if len(contents) < 1000:
+                contents.append(data)
+            else:
+                contents[rng.randrange(len(contents))] = data
+        r = rng.random()
+        if r < same_ratio and names:
+            name = rng.choice(names)
+            stats["same"] += 1
+        elif r < same_ratio + temp_ratio:
+            name += rng.choice([".tmp", "~"])
+            stats["temp"] += 1
+        elif r < same_ratio + temp_ratio + bad_name_ratio:
+            name = "bad:name?%d.dat" % i
+            stats["bad_name"] += 1
+        else:
+            names.append(name)
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            path = os.path.join(directory, "%d_%s" % (i, name))
+        with open(path, "wb") as f:
+            f.write(data)
+        if rng.random() < bad_perm_ratio:
+            os.chmod(path, 0o777)
+            stats["bad_perm"] += 1
+        else:
+            os.chmod(path, 0o644)
+        stats["files"] += 1
+        stats["bytes"] += len(data)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Creates a test directory structure. Without --files, the small fixed example tree is created."
+    )
+    parser.add_argument("base_dir", nargs="?", default="test_dir", help="Directory to create (default: test_dir)")
+    parser.add_argument("--files", type=int, help="Generate a synthetic tree with this many files")
+    parser.add_argument("--depth", type=int, default=3, help="Directory tree depth (default: 3)")
+    parser.add_argument("--fanout", type=int, default=4, help="Subdirectories per directory (default: 4)")
+    parser.add_argument("--size-median", type=int, default=4096, help="Median file size in bytes (default: 4096)")
+    parser.add_argument("--size-sigma", type=float, default=2.0, help="Spread of the log-normal file sizes (default: 2.0)")
+    parser.add_argument("--max-size", type=int, default=16777216, help="Maximum file size in bytes (default: 16 MiB)")
+    parser.add_argument("--dup-ratio", type=float, default=0.1, help="Fraction of duplicate files (default: 0.1)")
+    parser.add_argument("--same-ratio", type=float, default=0.05, help="Fraction of files reusing a name (default: 0.05)")
+    parser.add_argument("--temp-ratio", type=float, default=0.05, help="Fraction of temporary files (default: 0.05)")
+    parser.add_argument("--empty-ratio", type=float, default=0.02, help="Fraction of empty files (default: 0.02)")
+    parser.add_argument("--bad-perm-ratio", type=float, default=0.05, help="Fraction of files with mode 0777 (default: 0.05)")
+    parser.add_argument("--bad-name-ratio", type=float, default=0.02, help="Fraction of problematic names (default: 0.02)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+    if args.files is None:
+        create_test_structure(args.base_dir)
+        return
+    stats = generate_tree(
+        args.base_dir, files=args.files, depth=args.depth, fanout=args.fanout, size_median=args.size_median,
+        size_sigma=args.size_sigma, max_size=args.max_size, dup_ratio=args.dup_ratio, same_ratio=args.same_ratio,
+        temp_ratio=args.temp_ratio, empty_ratio=args.empty_ratio, bad_perm_ratio=args.bad_perm_ratio,
+        bad_name_ratio=args.bad_name_ratio, seed=args.seed,
+    )
+    print("Synthetic tree created in:", os.path.abspath(args.base_dir), stats)
+
+
 if __name__ == "__main__":
-    create_test_structure()
+    main()
@@ -1,9 +1,143 @@
+import os
+from Grouping import Grouper
+from Inventory import Inventory
+from Reporter import reporter
+from Stats import Stats
+
+
 class Cleaner:
     """ Base class for all cleaners. """
-    def __init__(self, directories, config, state):
+    name = None
+
+    def __init__(self, directories, config, state, inventory=None):
         self.directories = directories
         self.config = config
         self.state = state
+        self.inventory = inventory if inventory is not None else Inventory(directories, config)
+        self.plan = None
+        self.stats = Stats()
+
+    def files(self):
+        """Yields the records of all files in the shared inventory."""
+        for record in self.inventory.files():
+            self.stats.counters["files_visited"] += 1
+            reporter.progress(1)
+            yield record
+
+    def indexed_files(self):
+        """Yields (index, record) for all files in the shared inventory."""
+        for i, record in self.inventory.indexed_files():
+            self.stats.counters["files_visited"] += 1
+            reporter.progress(1)
+            yield i, record
+
+    def grouper(self):
+        """Returns a Grouper bounded by the configured memory budget for grouping inventory indexes."""
+        return Grouper(self.config.get("group_memory_limit", 536870912), self.config.get("spill_dir"))
+
+    def error(self, *message):
+        """Reports an error and counts it."""
+        self.stats.add("errors")
+        reporter.error(self.name, *message)
+
+    def confirm(self, question, flag):
+        """Asks 'question' unless the state flag 'flag' is set; answering 'a' sets the flag."""
+        if getattr(self.state, flag):
+            return True
+        reporter.flush()
+        with self.stats.phase("prompt"):
+            choice = input(question)
+        if choice.lower() == 'a':
+            setattr(self.state, flag, True)
+            return True
+        return choice.lower() == 'y'
+
+    def delete(self, record, question, duplicate_of=None):
+        """Deletes the file behind 'record' after confirmation, or adds the deletion to the plan."""
+        if self.plan is not None:
+            if duplicate_of is None:
+                self.plan.add(self.name, "remove", record)
+            else:
+                self.plan.add(self.name, "remove", record, duplicate_of=os.path.abspath(duplicate_of.path),
+                              duplicate_of_size=duplicate_of.size, duplicate_of_mtime_ns=duplicate_of.mtime_ns)
+            self.inventory.forget(record)
+            self.stats.add("actions")
+            reporter.action(self.name, "planned_remove", record.path)
+        elif self.confirm(question, "always_delete"):
+            with self.stats.phase("mutate"):
+                self.inventory.remove(record)
+            self.stats.add("actions")
+            reporter.action(self.name, "removed", record.path)
+        else:
+            reporter.action(self.name, "kept", record.path)
+
+    def link(self, record, target, question):
+        """Replaces the file behind 'record' with a hard link to 'target' after confirmation, or plans it."""
+        if self.plan is not None:
+            self.plan.add(self.name, "link", record, target=os.path.abspath(target.path),
+                          target_size=target.size, target_mtime_ns=target.mtime_ns)
+            self.stats.add("actions")
+            reporter.action(self.name, "planned_link", record.path, target=target.path)
+        elif self.confirm(question, "always_link"):
+            try:
+                with self.stats.phase("mutate"):
+                    self.inventory.link(record, target)
+                self.stats.add("actions")
+                reporter.action(self.name, "linked", record.path, target=target.path)
+            except Exception as e:
+                self.error("Error linking file:", record.path, e)
+        else:
+            reporter.action(self.name, "kept", record.path)
+
+    def change_mode(self, record, mode, question, batch=None):
+        """Changes the permissions of 'record' after confirmation, queues it in 'batch' or plans the change."""
+        if self.plan is not None:
+            self.plan.add(self.name, "chmod", record, mode=mode)
+            self.stats.add("actions")
+            reporter.action(self.name, "planned_chmod", record.path, mode=oct(mode))
+        elif self.confirm(question, "always_chmod"):
+            if batch is not None:
+                batch.append((record, mode))
+                return
+            with self.stats.phase("mutate"):
+                self.inventory.chmod(record, mode)
+            self.stats.add("actions")
+            reporter.action(self.name, "chmod", record.path, mode=oct(mode))
+        else:
+            reporter.action(self.name, "kept", record.path)
+
+    def flush_modes(self, batch):
+        """Applies the permission changes queued by change_mode() for one directory and clears 'batch'."""
+        if not batch:
+            return
+        with self.stats.phase("mutate"):
+            results = self.inventory.chmod_batch(batch)
+        for record, e in results:
+            if e is None:
+                self.stats.add("actions")
+                reporter.action(self.name, "chmod", record.path, mode=oct(record.mode & 0o777))
+            else:
+                self.error("Error changing permissions for", record.path, e)
+        del batch[:]
+
+    def rename(self, record, new_name, question):
+        """Renames the file behind 'record' after confirmation, or plans the rename."""
+        if self.plan is not None:
+            self.plan.add(self.name, "rename", record, new_name=new_name)
+            self.inventory.move(record, new_name)
+            self.stats.add("actions")
+            reporter.action(self.name, "planned_rename", record.path)
+        elif self.confirm(question, "always_rename"):
+            old_path = record.path
+            try:
+                with self.stats.phase("mutate"):
+                    self.inventory.rename(record, new_name)
+                self.stats.add("actions")
+                reporter.action(self.name, "renamed", record.path, old_path=old_path)
+            except Exception as e:
+                self.error("Error renaming file:", old_path, e)
+        else:
+            reporter.action(self.name, "kept", record.path)
 
     def run(self):
         raise NotImplementedError("Subclasses must implement this method.")
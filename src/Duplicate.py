@@ -1,61 +1,356 @@
-import hashlib
 import os
+import stat
 from Cleaner import Cleaner
+from HashCache import HashCache
+from Hashers import DEFAULT_HASHER, new_hasher
+from Reporter import reporter
+from Throttle import configure_worker, throttle
+from Workers import bounded_map, guarded, make_executor
 
 
 class DuplicateFileCleaner(Cleaner):
     """Handles the detection and deletion of duplicate files based on content."""
-    def __init__(self, directories, config, state):
-        super().__init__(directories, config, state)
+    name = "dups"
+
+    def __init__(self, directories, config, state, inventory=None):
+        super().__init__(directories, config, state, inventory)
+        self.buffer_size = config.get("hash_buffer_size", 1048576)
+        self.sample_size = config.get("partial_hash_size", 16384)
+        self.algorithm = config.get("hash_algorithm", DEFAULT_HASHER)
+        try:
+            new_hasher(self.algorithm)
+        except ValueError as e:
+            self.error("Error:", e, "- using", DEFAULT_HASHER)
+            self.algorithm = DEFAULT_HASHER
+        self.compare_max_group = config.get("compare_max_group", 3)
+        self.action = config.get("duplicate_action", "delete")
+        self.cache_path = config.get("hash_cache", ".clean_files_cache")
+        self.cache = None
+        self.jobs = config.get("jobs", 1)
+        self.executor_kind = config.get("hash_executor", "thread")
+        # Every file in flight holds one read buffer; keep their total below the memory limit.
+        memory_limit = config.get("hash_memory_limit", 268435456)
+        self.window = max(1, min(2 * self.jobs, memory_limit // self.buffer_size))
+        self.executor = None
 
     @staticmethod
-    def hash_file(file_path):
-        """Computes and returns the MD5 checksum of the file."""
-        hash_md5 = hashlib.md5()
+    def open_regular(file_path):
+        """Opens a regular file for unbuffered reading; raises ValueError for anything else."""
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, "O_NONBLOCK", 0) | getattr(os, "O_BINARY", 0))
         try:
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
-        except Exception as e:
-            print("Error hashing file", file_path, e)
-            return None
+            if not stat.S_ISREG(os.fstat(fd).st_mode):
+                raise ValueError("not a regular file")
+        except Exception:
+            os.close(fd)
+            raise
+        return open(fd, "rb", buffering=0)
 
-    def run(self):
-        file_hashes = {}
-        for d in self.directories:
-            for root, _, files in os.walk(d):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    file_hash = self.hash_file(file_path)
-                    if file_hash:
-                        file_hashes.setdefault(file_hash, []).append(file_path)
-        for h, files in file_hashes.items():
-            if len(files) > 1:
+    @staticmethod
+    def hash_file(file_path, buffer_size=1048576, algorithm=DEFAULT_HASHER):
+        """Computes and returns the digest of the file, reading it in large blocks."""
+        hasher = new_hasher(algorithm)
+        buffer = bytearray(buffer_size)
+        view = memoryview(buffer)
+        throttle.opened()
+        with DuplicateFileCleaner.open_regular(file_path) as f:
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                throttle.read(n)
+                hasher.update(view[:n])
+            throttle.done_reading(f.fileno())
+        return hasher.digest()
+
+    @staticmethod
+    def hash_sample(file_path, size, sample_size, algorithm=DEFAULT_HASHER):
+        """Computes the digest of the first and last 'sample_size' bytes of the file."""
+        hasher = new_hasher(algorithm)
+        throttle.opened()
+        with DuplicateFileCleaner.open_regular(file_path) as f:
+            if size <= 2 * sample_size:
+                throttle.read(size)
+                hasher.update(f.read(size))
+            else:
+                throttle.read(2 * sample_size)
+                hasher.update(f.read(sample_size))
+                f.seek(size - sample_size)
+                hasher.update(f.read(sample_size))
+            throttle.done_reading(f.fileno())
+        return hasher.digest()
+
+    @staticmethod
+    def compare_files(file_paths, buffer_size=1048576, algorithm=DEFAULT_HASHER):
+        """Compares equal-sized files block by block in lockstep.
+
+        Returns (lists of indexes of identical files, bytes read, (path, error) pairs,
+        full digest or None for every file).
+        """
+        files = []
+        identical = []
+        errors = []
+        digests = [None] * len(file_paths)
+        bytes_read = 0
+        try:
+            for i, file_path in enumerate(file_paths):
                 try:
-                    files.sort(key=lambda f: os.stat(f).st_mtime)
+                    throttle.opened()
+                    files.append((i, DuplicateFileCleaner.open_regular(file_path), new_hasher(algorithm)))
                 except Exception as e:
-                    print("Error sorting duplicates for:", files, e)
-                    continue
-                master = files[0]
-                print("\nDuplicates found for file (oldest retained):", master)
-                for duplicate in files[1:]:
-                    try:
-                        mtime = os.stat(duplicate).st_mtime
-                        print("Copy:", duplicate, " (mtime:", mtime, ")")
-                        if self.state.always_delete:
-                            os.remove(duplicate)
-                            print("Deleted:", duplicate)
+                    errors.append((file_path, e))
+            candidates = [files] if len(files) > 1 else []
+            while candidates:
+                remaining = []
+                for members in candidates:
+                    classes = []
+                    for member in members:
+                        i, f, hasher = member
+                        try:
+                            block = f.read(buffer_size)
+                        except Exception as e:
+                            errors.append((file_paths[i], e))
+                            continue
+                        bytes_read += len(block)
+                        throttle.read(len(block))
+                        hasher.update(block)
+                        for first, same in classes:
+                            if block == first:
+                                same.append(member)
+                                break
+                        else:
+                            classes.append((block, [member]))
+                    for block, same in classes:
+                        if not block:
+                            for i, _, hasher in same:
+                                digests[i] = hasher.digest()
+                        if len(same) < 2:
+                            continue
+                        if block:
+                            remaining.append(same)
                         else:
-                            choice = input("Delete this copy? (y - yes, n - no, a - always delete): ")
-                            if choice.lower() == 'y':
-                                os.remove(duplicate)
-                                print("Deleted:", duplicate)
-                            elif choice.lower() == 'a':
-                                self.state.always_delete = True
-                                os.remove(duplicate)
-                                print("Deleted:", duplicate)
-                            else:
-                                print("Left unchanged:", duplicate)
-                    except Exception as e:
-                        print("Error deleting duplicate", duplicate, e)
+                            identical.append([i for i, _, _ in same])
+                candidates = remaining
+        finally:
+            for _, f, _ in files:
+                throttle.done_reading(f.fileno())
+                f.close()
+        return identical, bytes_read, errors, digests
+
+    def open_cache(self):
+        """Opens the persistent hash cache unless it is disabled in the configuration."""
+        if not self.cache_path or self.cache_path.lower() == "none":
+            return None
+        try:
+            return HashCache(
+                self.cache_path,
+                self.algorithm,
+                rehash=self.config.get("rehash", False),
+                max_age_days=self.config.get("hash_cache_max_age", 30),
+            )
+        except Exception as e:
+            self.error("Error opening hash cache", self.cache_path, e)
+            return None
+
+    def digests(self, records, kind):
+        """Returns the 'partial' or 'full' digest of every record, in order."""
+        sample_size = self.sample_size if kind == "partial" else None
+        results = [None] * len(records)
+        missing = []
+        for i, record in enumerate(records):
+            if self.cache is not None:
+                results[i] = self.cache.get(record, kind, sample_size)
+            if not results[i]:
+                missing.append(i)
+        if kind == "partial":
+            args = ((self.hash_sample, records[i].path, records[i].size, self.sample_size, self.algorithm)
+                    for i in missing)
+            reads = [min(records[i].size, 2 * self.sample_size) for i in missing]
+        else:
+            args = ((self.hash_file, records[i].path, self.buffer_size, self.algorithm) for i in missing)
+            reads = [records[i].size for i in missing]
+        reporter.progress_start("dups: %s hashes" % kind, len(missing), sum(reads))
+        with self.stats.phase("hash"):
+            for i, size, (digest, e) in zip(missing, reads, bounded_map(self.executor, guarded, args, self.window)):
+                if e is not None:
+                    self.error("Error hashing file", records[i].path, e)
+                    continue
+                results[i] = digest
+                self.stats.add("bytes_read", size)
+                reporter.progress(1, size)
+                if self.cache is not None:
+                    self.cache.put(records[i], kind, digest, sample_size)
+        return results
+
+    def regroup(self, pairs):
+        """Groups (key, inventory index) pairs and returns the index lists of groups with several members."""
+        grouper = self.grouper()
+        try:
+            for key, i in pairs:
+                grouper.add(key, i)
+            return list(grouper.groups())
+        finally:
+            grouper.close()
+
+    def split(self, indexes, kind):
+        """Splits candidate indexes by size and 'partial' or 'full' digest."""
+        records = [self.inventory.record_at(i) for i in indexes]
+        digests = self.digests(records, kind)
+        return self.regroup(
+            (record.size.to_bytes(8, "big") + digest, i)
+            for i, record, digest in zip(indexes, records, digests) if digest
+        )
+
+    def compare(self, groups):
+        """Splits small groups of candidate indexes into groups of byte-identical files."""
+        identical = []
+        to_compare = []
+        for group in groups:
+            records = [self.inventory.record_at(i) for i in group]
+            if self.cache is not None:
+                digests = [self.cache.get(record, "full") for record in records]
+                if all(digests):
+                    identical.extend(self.regroup(zip(digests, group)))
+                    continue
+            to_compare.append(group)
+        args = (([self.inventory.record_at(i).path for i in group], self.buffer_size, self.algorithm)
+                for group in to_compare)
+        reporter.progress_start("dups: compare", sum(len(group) for group in to_compare),
+                                sum(len(group) * self.inventory.record_at(group[0]).size for group in to_compare))
+        with self.stats.phase("hash"):
+            results = bounded_map(self.executor, self.compare_files, args, self.window)
+            for group, (same, bytes_read, errors, digests) in zip(to_compare, results):
+                for path, e in errors:
+                    self.error("Error comparing file", path, e)
+                if self.cache is not None:
+                    for i, digest in zip(group, digests):
+                        if digest:
+                            self.cache.put(self.inventory.record_at(i), "full", digest)
+                self.stats.add("bytes_read", bytes_read)
+                reporter.progress(len(group), bytes_read)
+                identical.extend([group[k] for k in indexes] for indexes in same)
+        return identical
+
+    def find_duplicates(self):
+        """Returns groups of files with identical content, found via the size/sample/full stages.
+
+        Every group is a list of inodes and every inode a list of the records of its paths.
+        """
+        inventory = self.inventory
+
+        def sizes(indexes):
+            for i in indexes:
+                record = inventory.record_at(i)
+                if record.size is None:
+                    self.error("Error hashing file", record.path, "(cannot stat)")
+                    continue
+                if not stat.S_ISREG(record.mode):
+                    continue
+                yield record.size, i
+
+        candidates = [
+            i for group in self.regroup(sizes(i for i, _ in self.indexed_files()))
+            if inventory.focused(group) for i in group
+        ]
+        if any(inventory.record_at(i).cached for i in candidates):
+            # Sizes from the snapshot index may be stale; confirm them before reading any content.
+            for i in candidates:
+                inventory.refresh(inventory.record_at(i))
+            candidates = [i for group in self.regroup(sizes(candidates)) for i in group]
+
+        # Only the first path of every inode is compared; sizes that are left with a
+        # single inode drop out.
+        links = {}
+        first_paths = {}
+        representatives = []
+        for i in candidates:
+            record = inventory.record_at(i)
+            first = first_paths.setdefault((record.dev, record.ino), i)
+            if first != i:
+                links.setdefault(first, []).append(i)
+                continue
+            representatives.append(i)
+        if links:
+            candidates = [i for group in self.regroup(sizes(representatives)) for i in group]
+
+        duplicates = []
+        candidates_full = []
+        small_groups = []
+        for group in self.split(candidates, "partial"):
+            if len(group) <= self.compare_max_group:
+                small_groups.append(group)
+            elif inventory.record_at(group[0]).size <= 2 * self.sample_size:
+                # The sample already covered the whole content, so it is the full digest.
+                duplicates.append(group)
+            else:
+                candidates_full.extend(group)
+        duplicates.extend(self.compare(small_groups))
+        duplicates.extend(self.split(candidates_full, "full"))
+        if inventory.focus is not None:
+            duplicates = [group for group in duplicates if inventory.focused(group)]
+        return [
+            [[inventory.record_at(j) for j in [i] + links.get(i, [])] for i in group]
+            for group in duplicates
+        ]
+
+    def start(self):
+        """Opens the hash cache and the worker pool used by digests()."""
+        self.cache = self.open_cache()
+        self.executor = make_executor(self.jobs, self.executor_kind,
+                                      configure_worker, throttle.settings() + (self.jobs,))
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    def manifest_digests(self, records):
+        """Returns (partial digest, full digest or None) for every record; call between start() and stop()."""
+        first = {}
+        unique = [first.setdefault((r.dev, r.ino), i) == i and r.mode is not None and stat.S_ISREG(r.mode)
+                  for i, r in enumerate(records)]
+        partial = [None] * len(records)
+        indexes = [i for i in range(len(records)) if unique[i]]
+        for i, digest in zip(indexes, self.digests([records[i] for i in indexes], "partial")):
+            partial[i] = digest
+        full = [None] * len(records)
+        large = [i for i in indexes if records[i].size > 2 * self.sample_size and partial[i]]
+        for i, digest in zip(large, self.digests([records[i] for i in large], "full")):
+            full[i] = digest
+        results = []
+        for i, record in enumerate(records):
+            j = first[(record.dev, record.ino)]
+            results.append((partial[j], full[j]))
+        return results
+
+    def run(self):
+        self.start()
+        try:
+            duplicates = self.find_duplicates()
+        finally:
+            self.stop()
+        for inodes in duplicates:
+            inodes.sort(key=lambda paths: paths[0].mtime_ns)
+            master = inodes[0][0]
+            reporter.finding(self.name, "duplicate_group", master.path)
+            for record in inodes[0][1:]:
+                reporter.finding(self.name, "same_inode", record.path, duplicate_of=master.path)
+            for paths in inodes[1:]:
+                for record in paths:
+                    self.handle_copy(record, master)
+
+    def handle_copy(self, record, master):
+        """Deletes one copy of 'master', or replaces it with a hard link if so configured."""
+        duplicate = record.path
+        try:
+            reporter.finding(self.name, "duplicate", duplicate, mtime=record.mtime, duplicate_of=master.path)
+            if self.action != "link":
+                self.delete(record, "Delete this copy? (y - yes, n - no, a - always delete): ", master)
+            elif record.dev != master.dev:
+                reporter.finding(self.name, "other_device", duplicate)
+            else:
+                self.link(record, master, "Replace this copy with a hard link? (y - yes, n - no, a - always link): ")
+        except Exception as e:
+            self.error("Error deleting duplicate", duplicate, e)
@@ -1,10 +1,23 @@
 from Empty import EmptyFileCleaner
 from Temp import TempFileCleaner
 from Duplicate import DuplicateFileCleaner
+from Hashers import new_hasher
 from Same import SameNameFileCleaner
 from Attribute import AttributeCleaner
 from Rename import RenameCleaner
+from Inventory import Inventory
+from Manifest import ManifestMerger, ManifestWriter
+from Plan import PlanExecutor, PlanWriter
+from Reporter import reporter
+from Stats import Stats
+from Throttle import throttle
+from Watcher import Watcher
+import cProfile
+import json
+import pstats
+import signal
 import sys
+import time
 from dataclasses import dataclass
 
 
@@ -14,6 +27,7 @@ class CleanerState:
     always_delete: bool = False
     always_chmod: bool = False
     always_rename: bool = False
+    always_link: bool = False
 
 
 class FileCleaner:
@@ -22,26 +36,215 @@ class FileCleaner:
         self.directories = directories
         self.config = config
         self.mode = mode
-        self.state = CleanerState()
+        assume_yes = config.get("assume_yes", False)
+        self.state = CleanerState(always_delete=assume_yes, always_chmod=assume_yes, always_rename=assume_yes,
+                                  always_link=assume_yes)
+        self.inventory = Inventory(directories, config)
         self.operations = {
-            'empty': EmptyFileCleaner(directories, config, self.state),
-            'temp': TempFileCleaner(directories, config, self.state),
-            'dups': DuplicateFileCleaner(directories, config, self.state),
-            'same': SameNameFileCleaner(directories, config, self.state),
-            'attrib': AttributeCleaner(directories, config, self.state),
-            'rename': RenameCleaner(directories, config, self.state),
+            'empty': EmptyFileCleaner(directories, config, self.state, self.inventory),
+            'temp': TempFileCleaner(directories, config, self.state, self.inventory),
+            'dups': DuplicateFileCleaner(directories, config, self.state, self.inventory),
+            'same': SameNameFileCleaner(directories, config, self.state, self.inventory),
+            'attrib': AttributeCleaner(directories, config, self.state, self.inventory),
+            'rename': RenameCleaner(directories, config, self.state, self.inventory),
         }
         self.operation_order = ['empty', 'temp', 'dups', 'same', 'attrib', 'rename']
+        self.executor = None
+        self.merger = None
 
-    def run(self):
-        """Executes the specified cleaning operation or all operations if mode is 'all'."""
-        if self.mode == 'all':
+    def write_plan(self):
+        """Runs all operations without prompting and writes the proposed actions to the plan file."""
+        plan_file = self.config.get("plan_file", "clean_files.plan.jsonl")
+        try:
+            plan = PlanWriter(plan_file, self.directories, self.state)
+        except Exception as e:
+            reporter.error(None, "Error creating plan file", plan_file, e)
+            sys.exit(1)
+        try:
             for op_name in self.operation_order:
-                self.operations[op_name].run()
+                self.operations[op_name].plan = plan
+                self.run_operation(op_name)
+        finally:
+            plan.close()
+        reporter.info("\nPlan written to:", plan_file, "(%d action(s))" % plan.count)
+
+    def apply_plan(self):
+        """Executes the actions of the plan file that lie within the given directories."""
+        plan_file = self.config.get("plan_file", "clean_files.plan.jsonl")
+        self.executor = PlanExecutor(plan_file, self.directories, self.state, self.config.get("jobs", 1))
+        self.profiled("apply", self.executor.run)
+
+    def write_manifest(self):
+        """Writes the files of the scanned directories with their digests to the manifest file."""
+        manifest_file = self.config.get("manifest", "clean_files.manifest.bin")
+        dups = self.operations["dups"]
+        try:
+            writer = ManifestWriter(manifest_file, self.directories, dups.algorithm,
+                                    new_hasher(dups.algorithm).digest_size, dups.sample_size)
+        except Exception as e:
+            reporter.error(None, "Error creating manifest file", manifest_file, e)
+            sys.exit(1)
+        dups.start()
+        try:
+            with dups.stats.phase("run"):
+                chunk = []
+                for record in dups.files():
+                    # Records from the snapshot index may be stale; hash what is on disk.
+                    dups.inventory.refresh(record)
+                    if record.size is None:
+                        dups.error("Error getting attributes for", record.path)
+                        continue
+                    chunk.append(record)
+                    if len(chunk) >= 4096:
+                        self.add_to_manifest(writer, dups, chunk)
+                if chunk:
+                    self.add_to_manifest(writer, dups, chunk)
+        finally:
+            dups.stop()
+            writer.close()
+        reporter.info("Manifest written to:", manifest_file, "(%d file(s))" % writer.count)
+
+    @staticmethod
+    def add_to_manifest(writer, dups, chunk):
+        for record, (partial, full) in zip(chunk, dups.manifest_digests(chunk)):
+            writer.add(record, partial, full)
+        del chunk[:]
+
+    def merge_manifests(self):
+        """Combines the manifests given as 'directories' and writes one plan per manifest."""
+        self.merger = ManifestMerger(self.directories, self.config, self.state, self.config.get("plan_dir", "."))
+        try:
+            self.profiled("merge", self.merger.run)
+        except (OSError, ValueError) as e:
+            reporter.error(None, "Error merging manifests:", e)
+            sys.exit(1)
+
+    def watch(self):
+        """Runs all operations once, then again for every settled batch of changed files."""
+        try:
+            watcher = Watcher(self.directories, self.inventory, self.config.get("watch_debounce", 2.0))
+        except OSError as e:
+            reporter.error(None, "Error: watch mode requires Linux inotify:", e)
+            sys.exit(1)
+        for op_name in self.operation_order:
+            self.run_operation(op_name)
+        reporter.flush()
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for records in watcher.batches():
+                if records is not None:
+                    reporter.info("\nChanged files:", len(records))
+                    self.inventory.focus = set(records)
+                try:
+                    for op_name in self.operation_order:
+                        self.run_operation(op_name)
+                finally:
+                    self.inventory.focus = None
+                reporter.flush()
+        except KeyboardInterrupt:
+            reporter.info("\nWatch stopped")
+
+    def profiled(self, name, fn):
+        """Calls fn(), under cProfile if 'name' is the part selected with --profile."""
+        if self.config.get("profile") != name:
+            return fn()
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn)
+        finally:
+            output = self.config.get("profile_output")
+            if output:
+                profiler.dump_stats(output)
+                print("Profile of", name, "written to:", output, file=sys.stderr)
+            else:
+                pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+
+    def run_operation(self, op_name):
+        op = self.operations[op_name]
+        if reporter.show_progress:
+            reporter.progress_start(op_name, self.inventory.count())
+        try:
+            with op.stats.phase("run"):
+                self.profiled(op_name, op.run)
+        finally:
+            reporter.progress_end()
+
+    def collect_stats(self, wall_time):
+        """Returns the statistics of the scan and of every operation, plus their totals."""
+        parts = {"scan": self.inventory.stats}
+        for op_name in self.operation_order:
+            parts[op_name] = self.operations[op_name].stats
+        if self.executor is not None:
+            parts["apply"] = self.executor.stats
+        if self.merger is not None:
+            parts["merge"] = self.merger.stats
+        if throttle.stats.phases:
+            parts["throttle"] = throttle.stats
+        total = Stats()
+        for stats in parts.values():
+            total.merge(stats)
+        return {
+            "mode": self.mode,
+            "wall_time": round(wall_time, 6),
+            "total": total.as_dict(),
+            "parts": {name: stats.as_dict() for name, stats in parts.items()},
+        }
+
+    def report_stats(self, wall_time):
+        """Emits the run statistics in the format selected with --stats."""
+        fmt = self.config.get("stats")
+        if not fmt:
+            return
+        data = self.collect_stats(wall_time)
+        if fmt == "json":
+            text = json.dumps(data)
         else:
-            op = self.operations.get(self.mode)
-            if op:
-                op.run()
+            lines = ["\nRun statistics (wall time %.3fs):" % data["wall_time"]]
+            for name, part in data["parts"].items():
+                counters = ", ".join("%s=%d" % item for item in part["counters"].items() if item[1])
+                phases = ", ".join("%s=%.3fs" % item for item in part["phases"].items())
+                if counters or phases:
+                    lines.append("  %-8s %s%s%s" % (name, counters, "; " if counters and phases else "", phases))
+            counters = ", ".join("%s=%d" % item for item in data["total"]["counters"].items())
+            lines.append("  %-8s %s" % ("total", counters))
+            text = "\n".join(lines)
+        output = self.config.get("stats_file")
+        if output:
+            with open(output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+
+    def run(self):
+        """Executes the specified cleaning operation or all operations if mode is 'all'."""
+        start = time.perf_counter()
+        try:
+            if self.mode != 'apply' and (self.mode in ('all', 'plan', 'watch', 'scan') or self.mode in self.operations):
+                self.profiled("scan", self.inventory.scan)
+            if self.mode == 'plan':
+                self.write_plan()
+            elif self.mode == 'apply':
+                self.apply_plan()
+            elif self.mode == 'watch':
+                self.watch()
+            elif self.mode == 'scan':
+                self.write_manifest()
+            elif self.mode == 'merge':
+                self.merge_manifests()
+            elif self.mode == 'all':
+                for op_name in self.operation_order:
+                    self.run_operation(op_name)
             else:
-                print("Unknown mode:", self.mode)
-                sys.exit(1)
+                if self.mode in self.operations:
+                    self.run_operation(self.mode)
+                else:
+                    reporter.error(None, "Unknown mode:", self.mode)
+                    sys.exit(1)
+        finally:
+            self.inventory.close()
+            reporter.close()
+        self.report_stats(time.perf_counter() - start)
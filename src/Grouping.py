@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import tempfile
+
+
+class Grouper:
+    """Groups integer values by key, spilling to a temporary SQLite database above 'memory_limit' bytes."""
+    ENTRY_OVERHEAD = 120
+
+    def __init__(self, memory_limit=536870912, spill_dir=None):
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.groups_by_key = {}
+        self.used = 0
+        self.db = None
+        self.db_path = None
+
+    def add(self, key, value):
+        if self.db is not None:
+            self.db.execute("INSERT INTO items VALUES (?, ?)", (key, value))
+            return
+        group = self.groups_by_key.get(key)
+        if group is None:
+            self.groups_by_key[key] = [value]
+            self.used += self.ENTRY_OVERHEAD + (len(key) if not isinstance(key, int) else 8)
+        else:
+            group.append(value)
+            self.used += 8
+        if self.used > self.memory_limit:
+            self.spill()
+
+    def spill(self):
+        """Moves every entry to the temporary database and continues there."""
+        fd, self.db_path = tempfile.mkstemp(prefix="clean_files_groups_", suffix=".sqlite", dir=self.spill_dir)
+        os.close(fd)
+        self.db = sqlite3.connect(self.db_path)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("CREATE TABLE items (key, value INTEGER)")
+        self.db.executemany(
+            "INSERT INTO items VALUES (?, ?)",
+            ((key, value) for key, group in self.groups_by_key.items() for value in group),
+        )
+        self.groups_by_key = {}
+        self.used = 0
+
+    def groups(self, min_size=2):
+        """Yields the lists of values of every key that has at least 'min_size' values."""
+        if self.db is None:
+            for group in self.groups_by_key.values():
+                if len(group) >= min_size:
+                    yield group
+            return
+        self.db.execute("CREATE INDEX items_key ON items (key)")
+        cursor = self.db.execute(
+            "SELECT key, value FROM items WHERE key IN"
+            " (SELECT key FROM items GROUP BY key HAVING COUNT(*) >= ?)"
+            " ORDER BY key, rowid",
+            (min_size,),
+        )
+        current_key = None
+        group = []
+        for key, value in cursor:
+            if group and key != current_key:
+                yield group
+                group = []
+            current_key = key
+            group.append(value)
+        if group:
+            yield group
+
+    def close(self):
+        """Releases the memory or the temporary database."""
+        self.groups_by_key = {}
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            os.remove(self.db_path)
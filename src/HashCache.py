@@ -0,0 +1,88 @@
+import sqlite3
+import time
+
+
+class HashCache:
+    """Persistent on-disk store of partial and full file digests, keyed by file identity, size, mtime and algorithm."""
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path, algorithm, rehash=False, max_age_days=30, max_entries=10000000):
+        self.path = path
+        self.algorithm = algorithm
+        self.rehash = rehash
+        self.max_age = max_age_days * 86400
+        self.max_entries = max_entries
+        self.now = time.time()
+        self.seen = []
+        self.conn = sqlite3.connect(path)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS hashes")
+            self.conn.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            " dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, algorithm TEXT,"
+            " sample_size INTEGER, partial BLOB, full BLOB, last_seen REAL,"
+            " PRIMARY KEY (dev, ino, size, mtime_ns, algorithm))"
+        )
+
+    def key(self, record):
+        return (record.dev, record.ino, record.size, record.mtime_ns, self.algorithm)
+
+    def get(self, record, kind, sample_size=None):
+        """Returns the cached 'partial' or 'full' digest of the file behind 'record', or None."""
+        if self.rehash:
+            return None
+        row = self.conn.execute(
+            "SELECT sample_size, partial, full FROM hashes"
+            " WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ? AND algorithm = ?",
+            self.key(record),
+        ).fetchone()
+        if row is None:
+            return None
+        self.seen.append(self.key(record))
+        if kind == "partial":
+            return row[1] if row[0] == sample_size else None
+        return row[2]
+
+    def put(self, record, kind, digest, sample_size=None):
+        """Stores a 'partial' or 'full' digest of the file behind 'record'."""
+        key = self.key(record)
+        self.conn.execute(
+            "INSERT OR IGNORE INTO hashes (dev, ino, size, mtime_ns, algorithm, last_seen)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            key + (self.now,),
+        )
+        if kind == "partial":
+            self.conn.execute(
+                "UPDATE hashes SET partial = ?, sample_size = ?, last_seen = ?"
+                " WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ? AND algorithm = ?",
+                (digest, sample_size, self.now) + key,
+            )
+        else:
+            self.conn.execute(
+                "UPDATE hashes SET full = ?, last_seen = ?"
+                " WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ? AND algorithm = ?",
+                (digest, self.now) + key,
+            )
+
+    def evict(self):
+        """Removes entries that were not seen recently and trims the cache to 'max_entries'."""
+        self.conn.execute("DELETE FROM hashes WHERE last_seen < ?", (self.now - self.max_age,))
+        count = self.conn.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM hashes WHERE rowid IN"
+                " (SELECT rowid FROM hashes ORDER BY last_seen LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def close(self):
+        """Refreshes the last_seen time of every entry used in this run, evicts stale entries and saves."""
+        self.conn.executemany(
+            "UPDATE hashes SET last_seen = ?"
+            " WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ? AND algorithm = ?",
+            ((self.now,) + key for key in self.seen),
+        )
+        self.evict()
+        self.conn.commit()
+        self.conn.close()
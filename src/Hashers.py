@@ -0,0 +1,34 @@
+import hashlib
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+# Hash constructors by the name used for 'hash_algorithm' in '.clean_files'. Every
+# constructor returns an object with update() and digest(), like the hashlib objects.
+HASHERS = {
+    "blake2b": lambda: hashlib.blake2b(digest_size=32),
+    "sha256": hashlib.sha256,
+    "md5": hashlib.md5,
+}
+if xxhash is not None:
+    HASHERS["xxhash"] = getattr(xxhash, "xxh3_128", xxhash.xxh64)
+
+DEFAULT_HASHER = "blake2b"
+
+
+def available_hashers():
+    """Returns the names of the hash algorithms that can be used on this host."""
+    return sorted(HASHERS)
+
+
+def new_hasher(name):
+    """Returns a new hash object of the named algorithm; raises ValueError if it is unavailable."""
+    try:
+        return HASHERS[name]()
+    except KeyError:
+        if name == "xxhash":
+            raise ValueError("hash algorithm 'xxhash' requires the xxhash package") from None
+        raise ValueError("unknown hash algorithm %r (available: %s)" % (name, ", ".join(available_hashers()))) from None
@@ -0,0 +1,508 @@
+import json
+import os
+import queue
+import stat
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from Matcher import PathMatcher
+from Reporter import reporter
+from Snapshot import Snapshot
+from Stats import Stats
+from Throttle import throttle
+
+
+class FileRecord:
+    """Compact description of a single file found during the inventory scan."""
+    __slots__ = ("root", "name", "mode", "ino", "dev", "nlink", "size", "mtime_ns", "removed", "cached")
+
+    def __init__(self, root, name, st=None, cached=False):
+        self.root = root
+        self.name = name
+        self.set_stat(st)
+        self.removed = False
+        self.cached = cached
+
+    def set_stat(self, st):
+        """Copies the fields of interest from a stat result (or clears them for None)."""
+        if st is None:
+            self.mode = self.ino = self.dev = self.nlink = self.size = self.mtime_ns = None
+        else:
+            self.mode = st.st_mode
+            self.ino = st.st_ino
+            self.dev = st.st_dev
+            self.nlink = st.st_nlink
+            self.size = st.st_size
+            self.mtime_ns = st.st_mtime_ns
+
+    def fields(self):
+        """Returns the stat fields as a tuple, as stored in the snapshot index."""
+        return (self.mode, self.ino, self.dev, self.nlink, self.size, self.mtime_ns)
+
+    @classmethod
+    def from_fields(cls, root, name, fields, cached=False):
+        record = cls(root, name, cached=cached)
+        record.mode, record.ino, record.dev, record.nlink, record.size, record.mtime_ns = fields
+        return record
+
+    @property
+    def path(self):
+        return os.path.join(self.root, self.name)
+
+    @property
+    def mtime(self):
+        """Modification time in seconds, for display."""
+        return self.mtime_ns / 1e9
+
+
+class Inventory:
+    """Walks the directory trees once with os.scandir and caches a record for every regular file found."""
+    _DONE = object()
+
+    def __init__(self, directories, config=None):
+        config = config or {}
+        self.directories = directories
+        self.workers = config.get("scan_workers", 1)
+        self.sorted = config.get("scan_sorted", False)
+        self.queue_size = config.get("scan_queue_size", 1024)
+        self.incremental = config.get("incremental", False)
+        self.snapshot_path = config.get("snapshot", ".clean_files_snapshot")
+        self.reset_snapshot = config.get("reset_snapshot", False)
+        self.collect_dirs = config.get("scan_dirs", False)
+        self.one_file_system = config.get("one_file_system", False)
+        self.symlinks = config.get("symlinks", "skip")
+        self.exclude_globs = config.get("exclude", [])
+        self.exclude = PathMatcher(self.exclude_globs) if self.exclude_globs else None
+        self._parent_devs = {}
+        self._seen_dirs = set()
+        self._seen_lock = threading.Lock()
+        self._dirs = []
+        self._by_path = None
+        self.focus = None
+        self.snapshot = None
+        self.stats = Stats()
+        self._records = None
+
+    def excluded(self, root, name):
+        """Returns True if the entry 'name' in directory 'root' matches an exclude pattern."""
+        return self.exclude is not None and self.exclude.matches(root, name)
+
+    def first_visit(self, dir_stat):
+        """Returns True the first time a directory with this device and inode is seen."""
+        key = (dir_stat.st_dev, dir_stat.st_ino)
+        with self._seen_lock:
+            if key in self._seen_dirs:
+                return False
+            self._seen_dirs.add(key)
+            return True
+
+    def scan_dir(self, root):
+        """Scans one directory and returns (records of its files, paths of its subdirectories)."""
+        root = sys.intern(root)
+        dir_stat = None
+        if self.snapshot is not None or self.one_file_system or self.symlinks == "follow":
+            try:
+                self.stats.add("stats")
+                dir_stat = os.stat(root)
+            except OSError:
+                return [], []
+            parent_dev = self._parent_devs.pop(root, None)
+            if parent_dev is not None and dir_stat.st_dev != parent_dev:
+                return [], []
+            if self.symlinks == "follow" and not self.first_visit(dir_stat):
+                return [], []
+        if self.snapshot is not None:
+            if self.collect_dirs and root not in self.directories:
+                self._dirs.append(FileRecord(os.path.dirname(root), os.path.basename(root), dir_stat))
+            cached = self.snapshot.lookup(root, dir_stat)
+            if cached is not None:
+                files, subdirs = cached
+                self.descend(subdirs, dir_stat)
+                return [FileRecord.from_fields(root, name, fields, cached=True) for name, fields in files], subdirs
+        try:
+            with os.scandir(root) as it:
+                entries = list(it)
+        except OSError:
+            return [], []
+        if self.sorted:
+            entries.sort(key=lambda e: e.name)
+        follow = self.symlinks == "follow"
+        records = []
+        subdirs = []
+        for entry in entries:
+            if self.exclude is not None and self.exclude.matches(root, entry.name):
+                continue
+            try:
+                is_link = entry.is_symlink()
+                if is_link and self.symlinks == "skip":
+                    continue
+                is_dir = entry.is_dir(follow_symlinks=follow)
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if self.collect_dirs and self.snapshot is None and not is_link:
+                    self.stats.add("stats")
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if self.one_file_system and st.st_dev != dir_stat.st_dev:
+                        continue
+                    self._dirs.append(FileRecord(root, entry.name, st))
+                subdirs.append(entry.path)
+                continue
+            try:
+                st = entry.stat(follow_symlinks=self.symlinks != "file")
+            except OSError:
+                st = None
+            if st is not None and not (stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)):
+                continue
+            records.append(FileRecord(root, entry.name, st))
+        self.stats.add("stats", len(records))
+        self.descend(subdirs, dir_stat)
+        if self.snapshot is not None:
+            self.snapshot.store(root, dir_stat, [(r.name, r.fields()) for r in records], subdirs)
+        return records, subdirs
+
+    def descend(self, subdirs, dir_stat):
+        """Remembers the device of the parent of 'subdirs' for the 'one_file_system' check."""
+        if self.one_file_system:
+            for path in subdirs:
+                self._parent_devs[path] = dir_stat.st_dev
+
+    def walk_serial(self, roots):
+        """Yields lists of records, visiting each tree top-down like os.walk, one root after another."""
+        for top in roots:
+            stack = [top]
+            while stack:
+                records, subdirs = self.scan_dir(stack.pop())
+                yield records
+                stack.extend(reversed(subdirs))
+
+    def walk_sorted(self, roots, executor):
+        """Yields lists of records in serial top-down order while the pool scans ahead."""
+        def task(path):
+            records, subdirs = self.scan_dir(path)
+            return records, [executor.submit(task, sub) for sub in subdirs]
+
+        stack = [executor.submit(task, top) for top in reversed(roots)]
+        while stack:
+            records, children = stack.pop().result()
+            yield records
+            stack.extend(reversed(children))
+
+    def walk_unordered(self, roots):
+        """Yields lists of records in completion order from a pool of scanning threads.
+
+        An unexpected error in a scanning thread is raised here, in the consumer.
+        """
+        tasks = queue.Queue()
+        results = queue.Queue(maxsize=self.queue_size)
+        lock = threading.Lock()
+        pending = [len(roots)]
+
+        def worker():
+            while True:
+                path = tasks.get()
+                if path is None:
+                    return
+                try:
+                    records, subdirs = self.scan_dir(path)
+                    with lock:
+                        pending[0] += len(subdirs)
+                    for sub in subdirs:
+                        tasks.put(sub)
+                    results.put(records)
+                except Exception as e:
+                    # Handed to the consumer, which re-raises it instead of waiting forever.
+                    results.put(e)
+                finally:
+                    with lock:
+                        pending[0] -= 1
+                        finished = pending[0] == 0
+                    if finished:
+                        results.put(self._DONE)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+        for top in roots:
+            tasks.put(top)
+        try:
+            while roots:
+                records = results.get()
+                if records is self._DONE:
+                    break
+                if isinstance(records, Exception):
+                    raise records
+                yield records
+        finally:
+            for _ in threads:
+                tasks.put(None)
+
+    def scan(self):
+        """Performs the traversal of all directories and caches the resulting records."""
+        with self.stats.phase("scan"):
+            self._scan()
+        self.stats.add("files_visited", len(self._records))
+
+    def _scan(self):
+        roots = list(self.directories)
+        if self.incremental or self.reset_snapshot:
+            self.open_snapshot()
+        executor = None
+        if self.workers <= 1:
+            batches = self.walk_serial(roots)
+        elif self.sorted:
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+            batches = self.walk_sorted(roots, executor)
+        else:
+            batches = self.walk_unordered(roots)
+        records = []
+        reporter.progress_start("scan")
+        try:
+            for batch in batches:
+                records.extend(batch)
+                reporter.progress(len(batch))
+        finally:
+            reporter.progress_end()
+            if executor is not None:
+                executor.shutdown()
+        self._records = records
+        if self.sorted:
+            self._dirs.sort(key=lambda r: r.path)
+        if self.snapshot is not None:
+            self.snapshot.save()
+
+    def open_snapshot(self):
+        """Opens the snapshot index used for incremental scans, clearing it if requested."""
+        try:
+            options = json.dumps([self.one_file_system, self.symlinks, self.exclude_globs])
+            self.snapshot = Snapshot(self.snapshot_path, options=options)
+            if self.reset_snapshot:
+                self.snapshot.reset()
+                reporter.info("Snapshot index cleared:", self.snapshot_path)
+        except Exception as e:
+            reporter.error("scan", "Error opening snapshot index", self.snapshot_path, e)
+            self.snapshot = None
+        if not self.incremental and self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    def close(self):
+        """Saves pending snapshot changes at the end of a run."""
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    def files(self):
+        """Yields the records of all files that are still present (or of the focus), scanning on first use."""
+        if self._records is None:
+            self.scan()
+        if self.focus is not None:
+            yield from (r for r in self._records if r in self.focus and not r.removed)
+            return
+        for record in self._records:
+            if not record.removed:
+                yield record
+
+    def indexed_files(self):
+        """Yields (index, record) for all files that are still present, regardless of the focus; see record_at()."""
+        if self._records is None:
+            self.scan()
+        for i, record in enumerate(self._records):
+            if not record.removed:
+                yield i, record
+
+    def count(self):
+        """Returns the number of records that files() yields."""
+        if self._records is None:
+            self.scan()
+        if self.focus is not None:
+            return sum(1 for r in self.focus if not r.removed)
+        return sum(1 for r in self._records if not r.removed)
+
+    def dirs(self):
+        """Yields the records of the directories below the given ones (with 'scan_dirs' set)."""
+        if self._records is None:
+            self.scan()
+        for record in self._dirs:
+            if self.focus is None or record in self.focus:
+                yield record
+
+    def focused(self, indexes):
+        """Returns True if no focus is set or the focus contains one of the records at 'indexes'."""
+        return self.focus is None or any(self._records[i] in self.focus for i in indexes)
+
+    def path_index(self):
+        """Returns the {(root, name): record} index of present files, building it on first use."""
+        if self._by_path is None:
+            self._by_path = {(r.root, r.name): r for r in self._records if not r.removed}
+        return self._by_path
+
+    def update(self, root, name):
+        """Stats 'name' in 'root' and adds or refreshes its record; returns it, or None if not recorded."""
+        if self._records is None:
+            self.scan()
+        key = (sys.intern(root), name)
+        record = self.path_index().get(key)
+        st = None
+        if not self.excluded(root, name):
+            try:
+                self.stats.add("stats")
+                st = os.lstat(os.path.join(root, name))
+                if stat.S_ISLNK(st.st_mode) and self.symlinks != "file":
+                    st = os.stat(os.path.join(root, name)) if self.symlinks == "follow" else None
+            except OSError:
+                st = None
+        if st is None or not (stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)):
+            if record is not None:
+                self.forget(record)
+            return None
+        if record is None or record.removed:
+            record = FileRecord(key[0], name, st)
+            self._records.append(record)
+            self._by_path[key] = record
+        else:
+            record.set_stat(st)
+            record.cached = False
+        return record
+
+    def forget_tree(self, root, name=None):
+        """Drops the record of file 'name' in 'root', or with no name every record at or below 'root'."""
+        if self._records is None:
+            return
+        if name is not None:
+            record = self.path_index().get((root, name))
+            candidates = [record] if record is not None else []
+        else:
+            prefix = root.rstrip(os.sep) + os.sep
+            candidates = [r for r in self._records if r.root == root or r.root.startswith(prefix)]
+        for record in candidates:
+            self.forget(record)
+
+    def rescan(self):
+        """Forgets every record and scans the directories again."""
+        self._records = None
+        self._dirs = []
+        self._by_path = None
+        self._seen_dirs = set()
+        self.focus = None
+        self.scan()
+
+    def record_at(self, index):
+        """Returns the record with the given inventory index."""
+        return self._records[index]
+
+    def forget(self, record):
+        """Drops 'record' from the inventory without touching the file."""
+        record.removed = True
+        if self._by_path is not None:
+            self._by_path.pop((record.root, record.name), None)
+
+    def move(self, record, new_name):
+        """Updates 'record' to a new name within its directory without touching the file."""
+        if self._by_path is not None:
+            self._by_path.pop((record.root, record.name), None)
+            self._by_path[(record.root, new_name)] = record
+        record.name = new_name
+
+    def refresh(self, record):
+        """Replaces the stat of a record taken from the snapshot index with a fresh one."""
+        if record.cached:
+            try:
+                self.stats.add("stats")
+                record.set_stat(os.stat(record.path))
+            except OSError:
+                record.set_stat(None)
+            record.cached = False
+
+    def verify(self, record):
+        """Raises RuntimeError if a record taken from the snapshot index no longer matches its file."""
+        if record.cached:
+            self.stats.add("stats")
+            st = os.stat(record.path)
+            if (st.st_size, st.st_mtime_ns) != (record.size, record.mtime_ns):
+                raise RuntimeError("file changed since the snapshot was taken")
+
+    def remove(self, record):
+        """Deletes the file behind 'record' and drops it from the inventory."""
+        self.verify(record)
+        throttle.mutation()
+        os.remove(record.path)
+        self.forget(record)
+
+    def link(self, record, target):
+        """Replaces the file behind 'record' with a hard link to 'target', renamed over it from a temporary name."""
+        self.verify(record)
+        temp_path = os.path.join(record.root, ".%s.%d.link" % (record.name, os.getpid()))
+        throttle.mutation()
+        os.link(target.path, temp_path)
+        try:
+            os.replace(temp_path, record.path)
+        except OSError:
+            os.remove(temp_path)
+            raise
+        self.stats.add("stats")
+        record.set_stat(os.stat(record.path))
+        record.cached = False
+        target.nlink = record.nlink
+
+    def rename(self, record, new_name):
+        """Renames the file behind 'record' within its directory; never replaces an existing entry."""
+        new_path = os.path.join(record.root, new_name)
+        throttle.mutation()
+        try:
+            os.link(record.path, new_path, follow_symlinks=False)
+        except FileExistsError:
+            raise FileExistsError("target exists: " + new_path)
+        except OSError:
+            if os.path.lexists(new_path):
+                raise FileExistsError("target exists: " + new_path)
+            os.rename(record.path, new_path)
+        else:
+            try:
+                os.unlink(record.path)
+            except OSError:
+                os.unlink(new_path)
+                raise
+        self.move(record, new_name)
+
+    def chmod_batch(self, changes):
+        """Applies (record, mode) changes of one directory; returns (record, OSError or None) pairs."""
+        root = changes[0][0].root
+        fd = None
+        if hasattr(os, "O_DIRECTORY") and os.chmod in os.supports_dir_fd:
+            try:
+                fd = os.open(root, os.O_RDONLY | os.O_DIRECTORY)
+            except OSError:
+                fd = None
+        results = []
+        try:
+            for record, mode in changes:
+                throttle.mutation()
+                try:
+                    if fd is not None:
+                        os.chmod(record.name, mode, dir_fd=fd)
+                    else:
+                        os.chmod(record.path, mode)
+                except OSError as e:
+                    results.append((record, e))
+                    continue
+                record.mode = (record.mode & ~0o7777) | mode
+                results.append((record, None))
+        finally:
+            if fd is not None:
+                os.close(fd)
+        if self.snapshot is not None:
+            self.snapshot.invalidate(root)
+        return results
+
+    def chmod(self, record, mode):
+        """Changes the permissions of the file behind 'record'."""
+        throttle.mutation()
+        os.chmod(record.path, mode)
+        record.mode = (record.mode & ~0o7777) | mode
+        if self.snapshot is not None:
+            # A permission change does not update the directory's mtime.
+            self.snapshot.invalidate(record.root)
@@ -0,0 +1,221 @@
+import json
+import os
+import socket
+import struct
+import time
+from array import array
+from Grouping import Grouper
+from Inventory import FileRecord
+from Plan import PlanWriter
+from Reporter import reporter
+from Stats import Stats
+
+
+class ManifestWriter:
+    """Writes a binary manifest (header, then directory and file entries) of the files of one scan shard."""
+    MAGIC = b"CFMANIF1"
+    FILE = struct.Struct("<IHQqQQB")
+    HAS_PARTIAL = 1
+    HAS_FULL = 2
+
+    def __init__(self, path, directories, algorithm, digest_size, sample_size):
+        self.path = path
+        self.digest_size = digest_size
+        self.roots = {}
+        self.count = 0
+        self.f = open(path, "wb")
+        header = {
+            "version": 1,
+            "host": socket.gethostname(),
+            "created": time.time(),
+            "directories": [os.path.abspath(d) for d in directories],
+            "algorithm": algorithm,
+            "digest_size": digest_size,
+            "sample_size": sample_size,
+        }
+        data = json.dumps(header).encode("utf-8")
+        self.f.write(self.MAGIC + struct.pack("<I", len(data)) + data)
+
+    def add(self, record, partial, full):
+        root = self.roots.get(record.root)
+        if root is None:
+            root = self.roots[record.root] = len(self.roots)
+            data = os.fsencode(os.path.abspath(record.root))
+            self.f.write(b"D" + struct.pack("<I", len(data)) + data)
+        name = os.fsencode(record.name)
+        flags = (self.HAS_PARTIAL if partial else 0) | (self.HAS_FULL if full else 0)
+        self.f.write(b"F" + self.FILE.pack(root, len(name), record.size, record.mtime_ns,
+                                           record.ino, record.dev, flags) + name)
+        if partial:
+            self.f.write(partial)
+        if full:
+            self.f.write(full)
+        self.count += 1
+
+    def close(self):
+        self.f.close()
+
+
+class ManifestReader:
+    """Reads a manifest written by ManifestWriter; iterating yields one tuple per file:
+    (directory, name, size, mtime_ns, ino, dev, partial digest, full digest)."""
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "rb")
+        if self.f.read(len(ManifestWriter.MAGIC)) != ManifestWriter.MAGIC:
+            self.f.close()
+            raise ValueError("not a manifest file: " + path)
+        length, = struct.unpack("<I", self.f.read(4))
+        self.header = json.loads(self.f.read(length).decode("utf-8"))
+
+    def __iter__(self):
+        read = self.f.read
+        file_struct = ManifestWriter.FILE
+        digest_size = self.header["digest_size"]
+        roots = []
+        while True:
+            kind = read(1)
+            if not kind:
+                break
+            if kind == b"D":
+                length, = struct.unpack("<I", read(4))
+                roots.append(os.fsdecode(read(length)))
+                continue
+            root, name_len, size, mtime_ns, ino, dev, flags = file_struct.unpack(read(file_struct.size))
+            name = os.fsdecode(read(name_len))
+            partial = read(digest_size) if flags & ManifestWriter.HAS_PARTIAL else None
+            full = read(digest_size) if flags & ManifestWriter.HAS_FULL else None
+            yield roots[root], name, size, mtime_ns, ino, dev, partial, full
+
+    def close(self):
+        self.f.close()
+
+
+class ManifestMerger:
+    """Finds duplicate and same-name files across the manifests of several shards and writes one plan per shard."""
+    def __init__(self, paths, config, state, plan_dir="."):
+        self.paths = paths
+        self.config = config
+        self.state = state
+        self.plan_dir = plan_dir
+        self.action = config.get("duplicate_action", "delete")
+        self.stats = Stats()
+        self.records = []
+        self.shards = array("I")
+        self.headers = []
+        self.plans = []
+
+    def plan_paths(self):
+        """Returns the plan file of every manifest, adding the host or position to names that collide."""
+        names = []
+        for path in self.paths:
+            name = os.path.basename(path)
+            if name.endswith(".bin"):
+                name = name[:-len(".bin")]
+            names.append(name)
+        taken = list(names)
+        names = ["%s.%s" % (name, header["host"]) if taken.count(name) > 1 else name
+                 for name, header in zip(names, self.headers)]
+        taken = list(names)
+        names = ["%s.%d" % (name, i + 1) if taken.count(name) > 1 else name for i, name in enumerate(names)]
+        return [os.path.join(self.plan_dir, name + ".plan.jsonl") for name in names]
+
+    def load(self, dup_grouper, name_grouper):
+        """Reads every manifest into compact records and feeds both groupers."""
+        real_paths = [os.path.realpath(p) for p in self.paths]
+        for i, path in enumerate(real_paths):
+            if path in real_paths[:i]:
+                raise ValueError("manifest given more than once: " + self.paths[i])
+        for shard, path in enumerate(self.paths):
+            reader = ManifestReader(path)
+            try:
+                header = reader.header
+                if self.headers:
+                    first = self.headers[0]
+                    for key in ("algorithm", "sample_size"):
+                        if header[key] != first[key]:
+                            raise ValueError("%s uses %s %s, but %s uses %s" % (
+                                path, key, header[key], self.paths[0], first[key]))
+                self.headers.append(header)
+                sample_size = header["sample_size"]
+                for root, name, size, mtime_ns, ino, dev, partial, full in reader:
+                    i = len(self.records)
+                    self.records.append(FileRecord.from_fields(root, name, (None, ino, dev, None, size, mtime_ns)))
+                    self.shards.append(shard)
+                    self.stats.add("files_visited")
+                    digest = partial if size <= 2 * sample_size else full
+                    if digest:
+                        dup_grouper.add(size.to_bytes(8, "big") + digest, i)
+                    name_grouper.add(name, i)
+            finally:
+                reader.close()
+
+    def add_action(self, op, action, i, **params):
+        record = self.records[i]
+        self.plans[self.shards[i]].add(op, action, record, **params)
+        if action == "remove":
+            record.removed = True
+        self.stats.add("actions")
+
+    def merge_duplicates(self, dup_grouper):
+        for group in dup_grouper.groups():
+            inodes = {}
+            for i in group:
+                record = self.records[i]
+                host = self.headers[self.shards[i]]["host"]
+                inodes.setdefault((host, record.dev, record.ino), []).append(i)
+            if len(inodes) < 2:
+                continue
+            copies = sorted(inodes.items(), key=lambda item: self.records[item[1][0]].mtime_ns)
+            (master_host, master_dev, _), master_paths = copies[0]
+            master = self.records[master_paths[0]]
+            reporter.finding("dups", "duplicate_group", master.path)
+            for (host, dev, _), paths in copies[1:]:
+                for i in paths:
+                    if self.action == "link" and (host, dev) == (master_host, master_dev):
+                        self.add_action("dups", "link", i, target=master.path,
+                                        target_size=master.size, target_mtime_ns=master.mtime_ns)
+                        reporter.action("dups", "planned_link", self.records[i].path, target=master.path)
+                    elif host == master_host:
+                        # The retained file can only be checked by an apply on its own host.
+                        self.add_action("dups", "remove", i, duplicate_of=master.path,
+                                        duplicate_of_size=master.size, duplicate_of_mtime_ns=master.mtime_ns)
+                        reporter.action("dups", "planned_remove", self.records[i].path, duplicate_of=master.path)
+                    else:
+                        self.add_action("dups", "remove", i, duplicate_of=master.path)
+                        reporter.action("dups", "planned_remove", self.records[i].path, duplicate_of=master.path)
+
+    def merge_names(self, name_grouper):
+        for group in name_grouper.groups():
+            present = [i for i in group if not self.records[i].removed]
+            if len(present) < 2:
+                continue
+            present.sort(key=lambda i: self.records[i].mtime_ns, reverse=True)
+            newest = self.records[present[0]]
+            reporter.finding("same", "same_name_group", newest.path, name=newest.name)
+            for i in present[1:]:
+                self.add_action("same", "remove", i, newer_version=newest.path)
+                reporter.action("same", "planned_remove", self.records[i].path, newer_version=newest.path)
+
+    def run(self):
+        os.makedirs(self.plan_dir, exist_ok=True)
+        memory_limit = self.config.get("group_memory_limit", 536870912)
+        spill_dir = self.config.get("spill_dir")
+        dup_grouper = Grouper(memory_limit // 2, spill_dir)
+        name_grouper = Grouper(memory_limit // 2, spill_dir)
+        try:
+            with self.stats.phase("scan"):
+                self.load(dup_grouper, name_grouper)
+            for plan_path, header in zip(self.plan_paths(), self.headers):
+                self.plans.append(PlanWriter(plan_path, header["directories"], self.state))
+            try:
+                self.merge_duplicates(dup_grouper)
+                self.merge_names(name_grouper)
+            finally:
+                for plan in self.plans:
+                    plan.close()
+        finally:
+            dup_grouper.close()
+            name_grouper.close()
+        for plan in self.plans:
+            reporter.info("Plan written to:", plan.path, "(%d action(s))" % plan.count)
@@ -0,0 +1,66 @@
+import fnmatch
+import os
+import re
+
+
+class NameMatcher:
+    """Decides whether a file name matches any of a set of suffix, glob and regex rules."""
+    def __init__(self, suffixes=(), globs=(), regexes=()):
+        self.suffixes = tuple(suffixes)
+        self.glob_re = re.compile("|".join(fnmatch.translate(g) for g in globs)) if globs else None
+        self.regex_re = re.compile("|".join("(?:%s)" % r for r in regexes)) if regexes else None
+
+    def matches(self, name):
+        if name.endswith(self.suffixes):
+            return True
+        if self.glob_re is not None and self.glob_re.match(name):
+            return True
+        return self.regex_re is not None and self.regex_re.search(name) is not None
+
+
+class PathMatcher:
+    """Decides whether a directory entry is excluded by any of a set of name or path globs."""
+    def __init__(self, globs=()):
+        globs = [g.rstrip("/") or g for g in globs]
+        self.names = NameMatcher(globs=[g for g in globs if "/" not in g])
+        paths = [g for g in globs if "/" in g]
+        self.path_re = re.compile("|".join(fnmatch.translate(g) for g in paths)) if paths else None
+
+    def matches(self, root, name):
+        if self.names.matches(name):
+            return True
+        return self.path_re is not None and self.path_re.match(os.path.join(root, name)) is not None
+
+
+class NameTranslator:
+    """Replaces every problematic character of a file name in one str.translate() pass."""
+    def __init__(self, problematic_chars, substitute_char):
+        self.table = str.maketrans(dict.fromkeys(problematic_chars, substitute_char))
+
+    def translate(self, name):
+        return name.translate(self.table)
+
+    @staticmethod
+    def free_name(name, taken):
+        """Returns 'name', or 'stem_N.ext' with the smallest N >= 1 that is not in 'taken'."""
+        if name not in taken:
+            return name
+        stem, ext = os.path.splitext(name)
+        n = 1
+        while "%s_%d%s" % (stem, n, ext) in taken:
+            n += 1
+        return "%s_%d%s" % (stem, n, ext)
+
+
+def build_matchers(config):
+    """Compiles the temporary-file matcher and the rename table from the configuration."""
+    config["temp_matcher"] = NameMatcher(
+        config.get("temp_extensions", [".tmp", "~"]),
+        config.get("temp_patterns", []),
+        config.get("temp_regexes", []),
+    )
+    config["name_translator"] = NameTranslator(
+        config.get("problematic_chars", ":\".;*?$#'|\\"),
+        config.get("substitute_char", "."),
+    )
+    return config
@@ -1,4 +1,5 @@
 import argparse
+from Throttle import parse_ioprio, parse_size
 
 
 class ArgParser:
@@ -12,15 +13,161 @@ class ArgParser:
         self.parser.add_argument(
             "mode",
             nargs="?",
-            choices=["empty", "temp", "dups", "same", "attrib", "rename", "all"],
-            help="Operation mode: empty, temp, dups, same, attrib, rename, all. If not provided, all operations will be executed."
+            choices=["empty", "temp", "dups", "same", "attrib", "rename", "all", "plan", "apply", "watch", "scan",
+                     "merge"],
+            help="Operation mode: empty, temp, dups, same, attrib, rename, all, plan, apply, watch, scan, merge. If not provided, all operations will be executed."
         )
         self.parser.add_argument(
             "directories",
             nargs="+",
-            help="Directories to process"
+            help="Directories to process (for apply: only actions below these directories are executed; for merge: the manifest files to combine)"
+        )
+        self.parser.add_argument(
+            "--scan-workers",
+            type=int,
+            help="Number of threads scanning directories in parallel (default: 1, serial)."
+        )
+        self.parser.add_argument(
+            "--sorted",
+            action="store_true",
+            help="Visit directory entries in name order, so output is stable across runs."
+        )
+        self.parser.add_argument(
+            "--one-file-system",
+            action="store_true",
+            help="Do not descend into directories on other filesystems than the one they are found on."
+        )
+        self.parser.add_argument(
+            "--symlinks",
+            choices=["skip", "follow", "file"],
+            help="Symbolic links: skip them (default), follow them, or handle the link itself as a file."
+        )
+        self.parser.add_argument(
+            "--exclude",
+            action="append",
+            metavar="GLOB",
+            help="Skip files and directories whose name (or, with a '/', path) matches GLOB; can be repeated."
+        )
+        self.parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Reuse the listings of directories that did not change since the previous incremental run."
+        )
+        self.parser.add_argument(
+            "--reset-snapshot",
+            action="store_true",
+            help="Clear the snapshot index used by --incremental before scanning."
+        )
+        self.parser.add_argument(
+            "--report",
+            choices=["human", "jsonl", "csv"],
+            help="Format of findings and actions: human-readable text (default), JSON lines or CSV."
+        )
+        self.parser.add_argument(
+            "--report-file",
+            help="Write findings and actions to this file instead of standard output."
+        )
+        self.parser.add_argument(
+            "-q", "--quiet",
+            action="store_true",
+            help="Only count findings, actions and errors and print a summary at the end."
+        )
+        self.parser.add_argument(
+            "--progress",
+            action="store_true",
+            help="Show a progress line with files/s, bytes/s and ETA on standard error."
+        )
+        self.parser.add_argument(
+            "--stats",
+            choices=["text", "json"],
+            help="Print counters and per-phase timings of the run at the end, as text or JSON."
+        )
+        self.parser.add_argument(
+            "--stats-file",
+            help="Write the output of --stats to this file instead of standard output."
+        )
+        self.parser.add_argument(
+            "--profile",
+            choices=["scan", "empty", "temp", "dups", "same", "attrib", "rename", "apply", "merge"],
+            help="Run the selected part under cProfile and print the top functions to standard error."
+        )
+        self.parser.add_argument(
+            "--profile-output",
+            help="Write the cProfile data of --profile to this file (for pstats or snakeviz) instead."
+        )
+        self.parser.add_argument(
+            "--debounce",
+            type=float,
+            help="watch: seconds a changed file must stay quiet before it is handled (default: 2)."
+        )
+        self.parser.add_argument(
+            "--manifest",
+            help="scan: file to write the manifest of the scanned directories to (default: clean_files.manifest.bin)."
+        )
+        self.parser.add_argument(
+            "--plan-dir",
+            help="merge: directory for the per-manifest plan files (default: current directory)."
+        )
+        self.parser.add_argument(
+            "--plan-file",
+            help="Plan file written by the plan mode and read by the apply mode (default: clean_files.plan.jsonl)."
+        )
+        self.parser.add_argument(
+            "--link",
+            action="store_true",
+            help="Replace duplicate files with hard links to the retained copy instead of deleting them."
+        )
+        self.parser.add_argument(
+            "-y", "--yes",
+            action="store_true",
+            help="Perform every action without prompting (as if 'a' was answered to every prompt)."
+        )
+        self.parser.add_argument(
+            "--rehash",
+            action="store_true",
+            help="Ignore digests stored in the hash cache and hash every candidate file again."
+        )
+        self.parser.add_argument(
+            "--jobs",
+            type=int,
+            help="Number of workers used to hash files in parallel (default: 1, serial)."
+        )
+        self.parser.add_argument(
+            "--executor",
+            choices=["thread", "process"],
+            help="Kind of worker pool used with --jobs: thread (default) or process."
+        )
+        self.parser.add_argument(
+            "--read-limit",
+            type=parse_size,
+            help="Maximum bytes per second read from files, with an optional K, M or G suffix (e.g. 50M)."
+        )
+        self.parser.add_argument(
+            "--open-limit",
+            type=int,
+            help="Maximum number of files opened for reading per second."
+        )
+        self.parser.add_argument(
+            "--mutation-limit",
+            type=int,
+            help="Maximum number of deletions, renames, links and permission changes per second."
+        )
+        self.parser.add_argument(
+            "--drop-cache",
+            action="store_true",
+            help="Release the page cache of every file after hashing it (posix_fadvise DONTNEED)."
+        )
+        self.parser.add_argument(
+            "--nice",
+            type=int,
+            help="Lower the CPU priority of the run by this many nice levels."
+        )
+        self.parser.add_argument(
+            "--ioprio",
+            type=parse_ioprio,
+            help="I/O priority on Linux: idle, best-effort[:0-7] or realtime:0-7 (default: unchanged)."
         )
 
     def parse(self):
         """Parses command-line arguments and returns them."""
-        return self.parser.parse_args()
+        return self.parser.parse_intermixed_args()
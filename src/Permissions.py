@@ -0,0 +1,93 @@
+import fnmatch
+import os
+import re
+import stat
+
+
+SCRIPT_SUFFIXES = (".sh", ".bash", ".zsh", ".py", ".pl", ".rb", ".php", ".tcl", ".lua")
+
+
+def parse_mode(mode_str):
+    """Converts a symbolic file mode (e.g., 'rw-r--r--') into an integer (e.g., 0o644)."""
+    if len(mode_str) != 9:
+        print("Invalid mode format:", mode_str)
+        return None
+    first, second, third = mode_str[0:3], mode_str[3:6], mode_str[6:9]
+
+    def parse_part(part):
+        part_int = 0
+        if part[0] == "r":
+            part_int += 4
+        if part[1] == "w":
+            part_int += 2
+        if part[2] == "x":
+            part_int += 1
+        return part_int
+
+    return 0o100 * parse_part(first) + 0o10 * parse_part(second) + parse_part(third)
+
+
+def parse_rule_mode(mode_str):
+    """Parses a symbolic ('rwxr-xr-x') or octal ('755') mode; raises ValueError if invalid."""
+    if re.fullmatch(r"[0-7]{3}", mode_str):
+        return int(mode_str, 8)
+    if re.fullmatch(r"[r-][w-][x-][r-][w-][x-][r-][w-][x-]", mode_str):
+        return parse_mode(mode_str)
+    raise ValueError("invalid mode " + repr(mode_str))
+
+
+class PermissionRules:
+    """Ordered permission rules, compiled once and evaluated against cached stat results."""
+    DIR_KINDS = ("dir", "dir_name", "dir_path")
+
+    def __init__(self, rules=(), default_mode=None):
+        self.rules = list(rules)
+        self.default_mode = default_mode
+        self.has_dir_rules = any(kind in self.DIR_KINDS for kind, _, _ in self.rules)
+
+    @classmethod
+    def parse(cls, lines, default_mode=None):
+        """Compiles 'permission_rule' lines; invalid lines are reported and skipped."""
+        rules = []
+        for line in lines:
+            try:
+                parts = line.split()
+                if len(parts) != 2:
+                    raise ValueError("expected '<selector> <mode>'")
+                selector, mode_str = parts
+                mode = parse_rule_mode(mode_str)
+            except ValueError as e:
+                print("Invalid permission rule:", line, "-", e)
+                continue
+            prefix = ""
+            if selector.startswith("@dir:"):
+                prefix, selector = "dir_", selector[len("@dir:"):]
+            if selector in ("@dir", "@exec", "@script"):
+                rules.append((selector[1:], None, mode))
+            elif "/" in selector:
+                rules.append((prefix + "path", re.compile(fnmatch.translate(os.path.normpath(selector))), mode))
+            else:
+                rules.append((prefix + "name", re.compile(fnmatch.translate(selector)), mode))
+        return cls(rules, default_mode)
+
+    def expected_mode(self, record):
+        """Returns the permission bits 'record' should have, or None if no rule applies."""
+        is_dir = stat.S_ISDIR(record.mode)
+        for kind, pattern, mode in self.rules:
+            if (kind in self.DIR_KINDS) != is_dir:
+                continue
+            if kind == "dir":
+                return mode
+            elif kind in ("name", "dir_name"):
+                if pattern.match(record.name):
+                    return mode
+            elif kind in ("path", "dir_path"):
+                if pattern.match(os.path.normpath(record.path)):
+                    return mode
+            elif kind == "exec":
+                if record.mode & 0o111:
+                    return mode
+            elif kind == "script":
+                if record.name.endswith(SCRIPT_SUFFIXES):
+                    return mode
+        return None if is_dir else self.default_mode
@@ -0,0 +1,267 @@
+import json
+import os
+import stat
+import threading
+import uuid
+from Reporter import reporter
+from Stats import Stats
+from Throttle import throttle
+from Workers import make_executor
+
+
+class PlanWriter:
+    """Collects the actions proposed by the cleaners into a JSONL plan file."""
+    def __init__(self, path, directories, state):
+        self.path = path
+        self.count = 0
+        if os.path.exists(path + ".journal"):
+            os.remove(path + ".journal")
+        self.f = open(path, "w")
+        header = {
+            "type": "plan",
+            "version": 1,
+            "id": uuid.uuid4().hex,
+            "directories": [os.path.abspath(d) for d in directories],
+            "policy": {
+                "delete": state.always_delete,
+                "chmod": state.always_chmod,
+                "rename": state.always_rename,
+                "link": state.always_link,
+            },
+        }
+        self.f.write(json.dumps(header) + "\n")
+
+    def add(self, op, action, record, **params):
+        """Appends one action of cleaner 'op' ('remove', 'chmod', 'rename' or 'link') on the file behind 'record'."""
+        entry = {
+            "id": self.count,
+            "op": op,
+            "action": action,
+            "path": os.path.abspath(record.path),
+            "size": record.size,
+            "mtime_ns": record.mtime_ns,
+        }
+        entry.update(params)
+        self.f.write(json.dumps(entry) + "\n")
+        self.count += 1
+
+    def close(self):
+        self.f.close()
+
+
+class PlanExecutor:
+    """Applies a plan file written by PlanWriter, journaling progress so an interrupted apply can resume."""
+    POLICY_FLAGS = {"remove": "delete", "chmod": "chmod", "rename": "rename", "link": "link"}
+
+    def __init__(self, path, directories, state, jobs=1):
+        self.path = path
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.state = state
+        self.jobs = jobs
+        self.journal_path = path + ".journal"
+        self.lock = threading.Lock()
+        self.journal = None
+        self.plan_id = None
+        self.counts = {"done": 0, "skipped": 0, "failed": 0}
+        self.stats = Stats()
+
+    def in_scope(self, path):
+        return any(path == d or path.startswith(d.rstrip(os.sep) + os.sep) for d in self.directories)
+
+    def read_plan(self):
+        """Returns the plan header and the actions within the requested directories."""
+        with open(self.path, "r") as f:
+            header = json.loads(f.readline())
+            actions = [json.loads(line) for line in f if line.strip()]
+        if header.get("type") != "plan":
+            raise ValueError("not a plan file: " + self.path)
+        return header, [a for a in actions if self.in_scope(a["path"])]
+
+    def read_journal(self):
+        """Returns the ids of actions that a previous apply already finished."""
+        finished = set()
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of an interrupted apply
+                    if entry.get("plan") == self.plan_id and entry.get("status") in ("done", "skipped"):
+                        finished.add(entry["id"])
+        return finished
+
+    def log(self, entries, sync=False):
+        with self.lock:
+            for entry in entries:
+                entry["plan"] = self.plan_id
+                self.journal.write(json.dumps(entry) + "\n")
+            self.journal.flush()
+            if sync:
+                os.fsync(self.journal.fileno())
+
+    def approve(self, header, actions):
+        """Applies the plan-level policies, asking once per kind of action that is not pre-approved."""
+        approved = set()
+        policy = header.get("policy", {})
+        for action, flag in self.POLICY_FLAGS.items():
+            count = sum(1 for a in actions if a["action"] == action)
+            if not count:
+                continue
+            if policy.get(flag) or getattr(self.state, "always_" + flag):
+                approved.add(action)
+                continue
+            reporter.flush()
+            with self.stats.phase("prompt"):
+                choice = input("Apply %d planned %s action(s)? (y - yes, n - no): " % (count, action))
+            if choice.lower() == 'y':
+                approved.add(action)
+        return [a for a in actions if a["action"] in approved]
+
+    @staticmethod
+    def open_dir(directory):
+        """Returns a file descriptor for 'directory', or None where dir_fd syscalls are unavailable."""
+        if not hasattr(os, "O_DIRECTORY") or os.stat not in os.supports_dir_fd:
+            return None
+        return os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+
+    @staticmethod
+    def apply_action(action, directory, fd):
+        """Performs one action and returns (status, message)."""
+        def at(name):
+            return name if fd is not None else os.path.join(directory, name)
+
+        name = os.path.basename(action["path"])
+        if action["action"] == "link":
+            # The target must still hold the content that was compared during planning.
+            try:
+                target_st = os.stat(action["target"])
+            except FileNotFoundError:
+                return "skipped", "link target missing"
+            if (target_st.st_size, target_st.st_mtime_ns) != (action["target_size"], action["target_mtime_ns"]):
+                return "skipped", "link target changed since planning"
+        elif action["action"] == "remove" and "duplicate_of_size" in action:
+            # The retained file must still hold the content its copy was matched against.
+            try:
+                kept_st = os.stat(action["duplicate_of"])
+            except FileNotFoundError:
+                return "skipped", "retained file missing"
+            if (kept_st.st_size, kept_st.st_mtime_ns) != (action["duplicate_of_size"], action["duplicate_of_mtime_ns"]):
+                return "skipped", "retained file changed since planning"
+        try:
+            st = os.stat(at(name), dir_fd=fd)
+        except FileNotFoundError:
+            if action["action"] == "remove":
+                return "skipped", "already removed"
+            if action["action"] == "rename" and os.path.lexists(os.path.join(directory, action["new_name"])):
+                return "skipped", "already renamed"
+            return "skipped", "missing"
+        if action["action"] == "link" and (st.st_dev, st.st_ino) == (target_st.st_dev, target_st.st_ino):
+            return "skipped", "already linked"
+        if action["action"] == "chmod" and stat.S_ISDIR(st.st_mode):
+            pass  # entries added or removed since planning do not matter for a directory's mode
+        elif (st.st_size, st.st_mtime_ns) != (action["size"], action["mtime_ns"]):
+            return "skipped", "changed since planning"
+        throttle.mutation()
+        if action["action"] == "remove":
+            os.unlink(at(name), dir_fd=fd)
+            return "done", "Deleted"
+        if action["action"] == "chmod":
+            if fd is not None and os.chmod in os.supports_dir_fd:
+                os.chmod(name, action["mode"], dir_fd=fd)
+            else:
+                os.chmod(os.path.join(directory, name), action["mode"])
+            return "done", "Permissions changed"
+        if action["action"] == "rename":
+            new_name = action["new_name"]
+            if os.path.lexists(os.path.join(directory, new_name)):
+                return "skipped", "target exists"
+            os.rename(at(name), at(new_name), src_dir_fd=fd, dst_dir_fd=fd)
+            return "done", "Renamed to"
+        if action["action"] == "link":
+            temp_name = ".%s.%d.link" % (name, os.getpid())
+            os.link(action["target"], at(temp_name), dst_dir_fd=fd)
+            try:
+                os.replace(at(temp_name), at(name), src_dir_fd=fd, dst_dir_fd=fd)
+            except OSError:
+                os.unlink(at(temp_name), dir_fd=fd)
+                raise
+            return "done", "Linked"
+        return "failed", "unknown action " + str(action["action"])
+
+    def run_batch(self, directory, actions):
+        """Applies the actions of one directory in plan order."""
+        self.log(({"id": a["id"], "status": "begin"} for a in actions), sync=True)
+        results = []
+        try:
+            fd = self.open_dir(directory)
+        except OSError as e:
+            for a in actions:
+                results.append((a, "failed", str(e)))
+            fd = None
+            actions = []
+        try:
+            for a in actions:
+                try:
+                    status, message = self.apply_action(a, directory, fd)
+                except OSError as e:
+                    status, message = "failed", str(e)
+                results.append((a, status, message))
+        finally:
+            if fd is not None:
+                os.close(fd)
+        self.log({"id": a["id"], "status": status} for a, status, _ in results)
+        return results
+
+    def run(self):
+        try:
+            header, actions = self.read_plan()
+        except Exception as e:
+            reporter.error("apply", "Error reading plan file", self.path, e)
+            return
+        self.plan_id = header.get("id")
+        finished = self.read_journal()
+        actions = [a for a in actions if a["id"] not in finished]
+        if finished:
+            reporter.info("Resuming plan:", len(finished), "action(s) already applied,", len(actions), "remaining")
+        actions = self.approve(header, actions)
+        batches = {}
+        for a in actions:
+            batches.setdefault(os.path.dirname(a["path"]), []).append(a)
+        self.journal = open(self.journal_path, "a")
+        executor = make_executor(self.jobs)
+        reporter.progress_start("apply", len(actions))
+        try:
+            with self.stats.phase("mutate"):
+                self.apply_batches(executor, batches)
+        finally:
+            reporter.progress_end()
+            if executor is not None:
+                executor.shutdown()
+            self.journal.close()
+        reporter.info("\nPlan applied:", self.counts["done"], "done,", self.counts["skipped"], "skipped,",
+                      self.counts["failed"], "failed")
+
+    DONE_EVENTS = {"remove": "removed", "chmod": "chmod", "rename": "renamed", "link": "linked"}
+
+    def apply_batches(self, executor, batches):
+        if executor is None:
+            outcomes = (self.run_batch(d, batch) for d, batch in batches.items())
+        else:
+            outcomes = executor.map(self.run_batch, batches.keys(), batches.values())
+        for results in outcomes:
+            for a, status, message in results:
+                self.counts[status] += 1
+                self.stats.add("files_visited")
+                self.stats.add("stats")
+                if status == "failed":
+                    self.stats.add("errors")
+                reporter.progress(1)
+                if status == "done":
+                    self.stats.add("actions")
+                    target = a["path"]
+                    if a["action"] == "rename":
+                        target = os.path.join(os.path.dirname(target), a["new_name"])
+                    reporter.action(a["op"], self.DONE_EVENTS[a["action"]], target, id=a["id"])
+                else:
+                    reporter.action(a["op"], status, a["path"], id=a["id"], reason=message)
@@ -1,47 +1,49 @@
 import os
 from Cleaner import Cleaner
+from Matcher import build_matchers
+from Reporter import reporter
 
 
 class RenameCleaner(Cleaner):
     """Handles renaming files with problematic characters in their names."""
-    def __init__(self, directories, config, state):
-        super().__init__(directories, config, state)
-        self.problematic_chars = config.get("problematic_chars", ":\".;*?$#'|\\")
-        self.substitute_char = config.get("substitute_char", ".")
+    name = "rename"
+
+    def __init__(self, directories, config, state, inventory=None):
+        super().__init__(directories, config, state, inventory)
+        self.translator = config.get("name_translator") or build_matchers(dict(config))["name_translator"]
+
+    def name_index(self, roots):
+        """Returns {directory: set of entry names}, listing every directory in full."""
+        index = {root: set() for root in roots}
+        for root, names in index.items():
+            try:
+                names.update(os.listdir(root))
+            except OSError as e:
+                self.error("Error listing directory", root, e)
+        for _, record in self.inventory.indexed_files():
+            names = index.get(record.root)
+            if names is not None:
+                names.add(record.name)
+        return index
 
     def run(self):
-        for d in self.directories:
-            for root, _, files in os.walk(d):
-                for file in files:
-                    new_file = file
-                    for ch in self.problematic_chars:
-                        if ch in new_file:
-                            new_file = new_file.replace(ch, self.substitute_char)
-                    if new_file != file:
-                        old_path = os.path.join(root, file)
-                        new_path = os.path.join(root, new_file)
-                        print("\nFile with problematic name:", old_path)
-                        print("Proposed new name:", new_path)
-                        if self.state.always_rename:
-                            try:
-                                os.rename(old_path, new_path)
-                                print("Renamed to:", new_path)
-                            except Exception as e:
-                                print("Error renaming file:", old_path, e)
-                        else:
-                            choice = input("Rename? (y - yes, n - no, a - always rename): ")
-                            if choice.lower() == 'y':
-                                try:
-                                    os.rename(old_path, new_path)
-                                    print("Renamed to:", new_path)
-                                except Exception as e:
-                                    print("Error renaming file:", old_path, e)
-                            elif choice.lower() == 'a':
-                                self.state.always_rename = True
-                                try:
-                                    os.rename(old_path, new_path)
-                                    print("Renamed to:", new_path)
-                                except Exception as e:
-                                    print("Error renaming file:", old_path, e)
-                            else:
-                                print("Left unchanged:", old_path)
+        translate = self.translator.translate
+        renames = []
+        for record in self.files():
+            new_file = translate(record.name)
+            if new_file != record.name:
+                renames.append((record, new_file))
+        if not renames:
+            return
+        index = self.name_index({record.root for record, _ in renames})
+        for record, new_file in renames:
+            names = index[record.root]
+            new_file = self.translator.free_name(new_file, names)
+            old_path = record.path
+            old_file = record.name
+            new_path = os.path.join(record.root, new_file)
+            reporter.finding(self.name, "problematic_name", old_path, new_path=new_path)
+            self.rename(record, new_file, "Rename? (y - yes, n - no, a - always rename): ")
+            if record.name != old_file:
+                names.discard(old_file)
+                names.add(record.name)
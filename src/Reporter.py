@@ -0,0 +1,239 @@
+import csv
+import json
+import sys
+import threading
+import time
+
+
+class HumanSink:
+    """Formats events as the plain text messages of an interactive run."""
+    FORMATS = {
+        "empty_file": "\nEmpty file: {path}",
+        "temp_file": "\nTemporary file: {path}",
+        "duplicate_group": "\nDuplicates found for file (oldest retained): {path}",
+        "same_inode": "Same inode: {path}",
+        "duplicate": "Copy: {path}  (mtime: {mtime} )",
+        "other_device": "On another device, left unchanged: {path}",
+        "same_name_group": "\nFiles with name: {name}\nRetained version (newest): {path}",
+        "older_version": "Older version: {path}  (mtime: {mtime} )",
+        "mode_mismatch": "\nFile: {path}\nCurrent permissions: {current} Expected: {expected}",
+        "problematic_name": "\nFile with problematic name: {path}\nProposed new name: {new_path}",
+        "planned_remove": "Planned deletion: {path}",
+        "planned_link": "Planned hard link: {path}",
+        "planned_chmod": "Planned permission change: {path}",
+        "planned_rename": "Planned rename to: {path}",
+        "removed": "Deleted: {path}",
+        "linked": "Linked: {path}",
+        "chmod": "Permissions changed: {path}",
+        "renamed": "Renamed to: {path}",
+        "kept": "Left unchanged: {path}",
+        "skipped": "Skipped ({reason}): {path}",
+        "failed": "Failed ({reason}): {path}",
+    }
+
+    def __init__(self, write):
+        self.write = write
+
+    def event(self, kind, op, name, path, fields):
+        self.write(self.FORMATS[name].format(path=path, **fields) + "\n")
+
+    def message(self, kind, op, text):
+        self.write(text + "\n")
+
+    def summary(self, counts, errors):
+        lines = ["\nSummary:"]
+        ops = sorted({op for op, _ in counts} | set(errors), key=str)
+        for op in ops:
+            parts = ["%s=%d" % (name, n) for (o, name), n in sorted(counts.items(), key=str) if o == op]
+            if errors.get(op):
+                parts.append("errors=%d" % errors[op])
+            lines.append("  %-8s %s" % (op or "-", ", ".join(parts)))
+        self.write("\n".join(lines) + "\n")
+
+
+class JsonlSink:
+    """Formats every event as one JSON object per line."""
+    def __init__(self, write):
+        self.write = write
+
+    def event(self, kind, op, name, path, fields):
+        data = {"type": kind, "op": op, "event": name, "path": path}
+        data.update(fields)
+        self.write(json.dumps(data) + "\n")
+
+    def message(self, kind, op, text):
+        self.write(json.dumps({"type": kind, "op": op, "message": text.strip()}) + "\n")
+
+    def summary(self, counts, errors):
+        data = {"type": "summary", "counts": {}, "errors": sum(errors.values())}
+        for (op, name), n in sorted(counts.items(), key=str):
+            data["counts"].setdefault(op, {})[name] = n
+        self.write(json.dumps(data) + "\n")
+
+
+class CsvSink:
+    """Formats every event as a row of type, op, event, path and detail (extra fields as JSON)."""
+    COLUMNS = ("type", "op", "event", "path", "detail")
+
+    def __init__(self, write):
+        self.write = write
+        self.writer = csv.writer(self, lineterminator="\n")
+        self.writer.writerow(self.COLUMNS)
+
+    def event(self, kind, op, name, path, fields):
+        self.writer.writerow((kind, op, name, path, json.dumps(fields) if fields else ""))
+
+    def message(self, kind, op, text):
+        self.writer.writerow((kind, op, "", "", text.strip()))
+
+    def summary(self, counts, errors):
+        for (op, name), n in sorted(counts.items(), key=str):
+            self.writer.writerow(("summary", op, name, "", n))
+        for op, n in sorted(errors.items(), key=str):
+            self.writer.writerow(("summary", op, "errors", "", n))
+
+
+class Reporter:
+    """Collects the findings, actions and messages of a run and writes them in batches."""
+    SINKS = {"human": HumanSink, "jsonl": JsonlSink, "csv": CsvSink}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.errors = {}
+        self.lines = []
+        self.output = sys.stdout
+        self.close_output = False
+        self.format = "human"
+        self.quiet = False
+        self.batch_size = 1
+        self.sink = HumanSink(self.lines.append)
+        self.show_progress = False
+        self.progress_interval = 0.5
+        self.stage = None
+
+    def configure(self, fmt="human", output=None, quiet=False, progress=False, batch_size=512):
+        """Selects the sink and the output (a path, or standard output for None)."""
+        self.flush()
+        if output:
+            self.output = open(output, "w", newline="")
+            self.close_output = True
+        self.format = fmt
+        self.quiet = quiet
+        self.show_progress = progress
+        self.batch_size = batch_size
+        self.sink = self.SINKS[fmt](self.lines.append)
+
+    def finding(self, op, name, path, /, **fields):
+        """Reports something an operation found, e.g. an empty file or a group of duplicates."""
+        self.event("finding", op, name, path, fields)
+
+    def action(self, op, name, path, /, **fields):
+        """Reports an action taken (or planned, or declined) on a file."""
+        self.event("action", op, name, path, fields)
+
+    def event(self, kind, op, name, path, fields):
+        with self.lock:
+            key = (op, name)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if self.quiet:
+                return
+            self.sink.event(kind, op, name, path, fields)
+            pending = len(self.lines)
+        if pending >= self.batch_size:
+            self.flush()
+
+    def error(self, op, *message):
+        """Reports an error; the message is built like the arguments of print()."""
+        with self.lock:
+            self.errors[op] = self.errors.get(op, 0) + 1
+            if self.quiet:
+                return
+            self.sink.message("error", op, " ".join(str(m) for m in message))
+            pending = len(self.lines)
+        if pending >= self.batch_size:
+            self.flush()
+
+    def info(self, *message):
+        """Reports a status message of the run, such as where a plan was written."""
+        if self.quiet:
+            return
+        with self.lock:
+            self.sink.message("info", None, " ".join(str(m) for m in message))
+            pending = len(self.lines)
+        if pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered lines; called before prompts so that they follow their context."""
+        with self.lock:
+            if not self.lines:
+                return
+            data = "".join(self.lines)
+            del self.lines[:]
+            if self.stage is not None and self.stage["shown"]:
+                sys.stderr.write("\r\033[K")
+                self.stage["shown"] = False
+            self.output.write(data)
+            self.output.flush()
+
+    def close(self):
+        """Writes the summary (in quiet mode or for structured sinks) and flushes everything."""
+        self.progress_end()
+        if self.quiet or self.format != "human":
+            with self.lock:
+                self.sink.summary(self.counts, self.errors)
+        self.flush()
+        if self.close_output:
+            self.output.close()
+            self.output = sys.stdout
+            self.close_output = False
+
+    def progress_start(self, label, total_files=0, total_bytes=0):
+        """Starts a progress stage; the ETA is based on the bytes, or else the files, of the totals."""
+        if not self.show_progress:
+            return
+        self.progress_end()
+        now = time.monotonic()
+        self.stage = {"label": label, "files": 0, "bytes": 0, "total_files": total_files,
+                      "total_bytes": total_bytes, "start": now, "last": now, "shown": False}
+
+    def progress(self, files=0, nbytes=0):
+        """Counts work done in the current stage and redraws the status line if it is due."""
+        stage = self.stage
+        if stage is None:
+            return
+        stage["files"] += files
+        stage["bytes"] += nbytes
+        now = time.monotonic()
+        if now - stage["last"] >= self.progress_interval:
+            stage["last"] = now
+            self.draw(stage, now)
+
+    def draw(self, stage, now):
+        elapsed = max(now - stage["start"], 1e-9)
+        files_rate = stage["files"] / elapsed
+        bytes_rate = stage["bytes"] / elapsed
+        line = "%s: %d files (%.0f files/s), %.1f MiB (%.1f MiB/s)" % (
+            stage["label"], stage["files"], files_rate, stage["bytes"] / 1048576, bytes_rate / 1048576)
+        eta = None
+        if stage["total_bytes"] and bytes_rate:
+            eta = max(0, stage["total_bytes"] - stage["bytes"]) / bytes_rate
+        elif stage["total_files"] and files_rate:
+            eta = max(0, stage["total_files"] - stage["files"]) / files_rate
+        if eta is not None:
+            line += ", ETA %d:%02d" % divmod(int(eta), 60)
+        sys.stderr.write("\r\033[K" + line)
+        sys.stderr.flush()
+        stage["shown"] = True
+
+    def progress_end(self):
+        """Ends the current progress stage and clears its status line."""
+        stage = self.stage
+        self.stage = None
+        if stage is not None and stage["shown"]:
+            sys.stderr.write("\r\033[K")
+            sys.stderr.flush()
+
+
+reporter = Reporter()
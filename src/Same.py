@@ -1,46 +1,36 @@
-import os
 from Cleaner import Cleaner
+from Reporter import reporter
 
 
 class SameNameFileCleaner(Cleaner):
     """Handles files with the same name, keeping the newest version."""
-    def __init__(self, directories, config, state):
-        super().__init__(directories, config, state)
+    name = "same"
+
+    def __init__(self, directories, config, state, inventory=None):
+        super().__init__(directories, config, state, inventory)
 
     def run(self):
-        name_dict = {}
-        for d in self.directories:
-            for root, _, files in os.walk(d):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    name_dict.setdefault(file, []).append(file_path)
-        for name, files in name_dict.items():
-            if len(files) > 1:
-                try:
-                    files.sort(key=lambda f: os.stat(f).st_mtime, reverse=True)
-                except Exception as e:
-                    print("Error sorting files with name", name, e)
+        grouper = self.grouper()
+        try:
+            for i, record in self.indexed_files():
+                grouper.add(record.name, i)
+            for indexes in grouper.groups():
+                if not self.inventory.focused(indexes):
+                    continue
+                records = [self.inventory.record_at(i) for i in indexes]
+                name = records[0].name
+                if any(r.size is None for r in records):
+                    self.error("Error sorting files with name", name)
                     continue
-                master = files[0]
-                print("\nFiles with name:", name)
-                print("Retained version (newest):", master)
-                for older in files[1:]:
+                records.sort(key=lambda r: r.mtime_ns, reverse=True)
+                master = records[0]
+                reporter.finding(self.name, "same_name_group", master.path, name=name)
+                for record in records[1:]:
+                    older = record.path
                     try:
-                        mtime = os.stat(older).st_mtime
-                        print("Older version:", older, " (mtime:", mtime, ")")
-                        if self.state.always_delete:
-                            os.remove(older)
-                            print("Deleted:", older)
-                        else:
-                            choice = input("Delete this older version? (y - yes, n - no, a - always delete): ")
-                            if choice.lower() == 'y':
-                                os.remove(older)
-                                print("Deleted:", older)
-                            elif choice.lower() == 'a':
-                                self.state.always_delete = True
-                                os.remove(older)
-                                print("Deleted:", older)
-                            else:
-                                print("Left unchanged:", older)
+                        reporter.finding(self.name, "older_version", older, mtime=record.mtime)
+                        self.delete(record, "Delete this older version? (y - yes, n - no, a - always delete): ")
                     except Exception as e:
-                        print("Error deleting file", older, e)
+                        self.error("Error deleting file", older, e)
+        finally:
+            grouper.close()
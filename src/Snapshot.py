@@ -0,0 +1,104 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class Snapshot:
+    """Persistent index of scanned directories and the files directly inside them."""
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path, racy_seconds=2, options=""):
+        self.path = path
+        self.racy_limit = time.time_ns() - racy_seconds * 1000000000
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.updates = {}
+        self.invalid = set()
+        conn = self.connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            conn.execute("DROP TABLE IF EXISTS dirs")
+            conn.execute("DROP TABLE IF EXISTS files")
+            conn.execute("DROP TABLE IF EXISTS meta")
+            conn.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS dirs ("
+            " path TEXT PRIMARY KEY, dev INTEGER, ino INTEGER, mtime_ns INTEGER, subdirs TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " dir TEXT, name TEXT, mode INTEGER, ino INTEGER, dev INTEGER, nlink INTEGER,"
+            " size INTEGER, mtime_ns INTEGER, PRIMARY KEY (dir, name))"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = conn.execute("SELECT value FROM meta WHERE key = 'options'").fetchone()
+        if row is None or row[0] != options:
+            conn.execute("DELETE FROM dirs")
+            conn.execute("DELETE FROM files")
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('options', ?)", (options,))
+        conn.commit()
+
+    def connection(self):
+        """Returns the SQLite connection of the calling thread."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            self.local.conn = conn
+        return conn
+
+    def lookup(self, path, st):
+        """Returns ([(name, stat fields)], subdirectory paths) if 'path' is unchanged, otherwise None."""
+        conn = self.connection()
+        row = conn.execute("SELECT dev, ino, mtime_ns, subdirs FROM dirs WHERE path = ?", (path,)).fetchone()
+        if row is None or tuple(row[:3]) != (st.st_dev, st.st_ino, st.st_mtime_ns):
+            return None
+        files = [
+            (r[0], r[1:]) for r in conn.execute(
+                "SELECT name, mode, ino, dev, nlink, size, mtime_ns FROM files WHERE dir = ? ORDER BY rowid", (path,)
+            )
+        ]
+        return files, json.loads(row[3])
+
+    def store(self, path, st, files, subdirs):
+        """Queues the listing of 'path' ([(name, stat fields)], subdirectory paths) for saving."""
+        if st.st_mtime_ns >= self.racy_limit:
+            return
+        with self.lock:
+            self.updates[path] = (st, files, subdirs)
+
+    def invalidate(self, path):
+        """Forgets the listing of 'path', e.g. after a change that does not update the directory's mtime."""
+        with self.lock:
+            self.invalid.add(path)
+            self.updates.pop(path, None)
+
+    def reset(self):
+        """Drops every directory and file from the index."""
+        conn = self.connection()
+        conn.execute("DELETE FROM dirs")
+        conn.execute("DELETE FROM files")
+        conn.commit()
+
+    def save(self):
+        """Writes the queued listings and invalidations to disk."""
+        conn = self.connection()
+        with self.lock:
+            updates, self.updates = self.updates, {}
+            invalid, self.invalid = self.invalid, set()
+        for path in list(updates) + list(invalid):
+            conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+            conn.execute("DELETE FROM files WHERE dir = ?", (path,))
+        for path, (st, files, subdirs) in updates.items():
+            conn.execute(
+                "INSERT INTO dirs (path, dev, ino, mtime_ns, subdirs) VALUES (?, ?, ?, ?, ?)",
+                (path, st.st_dev, st.st_ino, st.st_mtime_ns, json.dumps(subdirs)),
+            )
+            conn.executemany(
+                "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((path, name) + tuple(fields) for name, fields in files),
+            )
+        conn.commit()
+
+    def close(self):
+        self.save()
+        self.connection().close()
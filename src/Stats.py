@@ -0,0 +1,41 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Stats:
+    """Counters and per-phase wall times collected by one part of a run."""
+    COUNTERS = ("files_visited", "stats", "bytes_read", "actions", "errors")
+
+    def __init__(self):
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def add(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    @contextmanager
+    def phase(self, name):
+        """Adds the wall time spent inside the 'with' block to phase 'name'."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def merge(self, other):
+        """Adds the counters and phase times of 'other' to this object."""
+        for counter, n in other.counters.items():
+            self.counters[counter] += n
+        for name, elapsed in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def as_dict(self):
+        return {
+            "counters": dict(self.counters),
+            "phases": {name: round(elapsed, 6) for name, elapsed in self.phases.items()},
+        }
@@ -0,0 +1,146 @@
+import ctypes
+import ctypes.util
+import os
+import platform
+import threading
+import time
+from Reporter import reporter
+from Stats import Stats
+
+
+class TokenBucket:
+    """Limits an activity to 'rate' units per second with bursts of up to 'burst' units."""
+    def __init__(self, rate, burst=None, stats=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+        self.stats = stats
+
+    def take(self, n=1):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            if self.stats is not None:
+                with self.stats.phase("throttle"):
+                    time.sleep(wait)
+            else:
+                time.sleep(wait)
+
+
+class Throttle:
+    """Process-wide limits for reading file contents and for mutating syscalls."""
+    def __init__(self):
+        self.stats = Stats()
+        self.reads = None
+        self.opens = None
+        self.mutations = None
+        self.drop_cache = False
+
+    def configure(self, read_limit=0, open_limit=0, mutation_limit=0, drop_cache=False, share=1):
+        """Sets the limits; 'share' divides them among that many worker processes."""
+        self.reads = TokenBucket(read_limit / share, stats=self.stats) if read_limit else None
+        self.opens = TokenBucket(open_limit / share, stats=self.stats) if open_limit else None
+        self.mutations = TokenBucket(mutation_limit, stats=self.stats) if mutation_limit else None
+        self.drop_cache = drop_cache and hasattr(os, "posix_fadvise")
+
+    def settings(self):
+        """Returns the configure() arguments, e.g. to set up worker processes."""
+        return (
+            self.reads.rate if self.reads else 0,
+            self.opens.rate if self.opens else 0,
+            self.mutations.rate if self.mutations else 0,
+            self.drop_cache,
+        )
+
+    def opened(self):
+        if self.opens is not None:
+            self.opens.take()
+
+    def read(self, n):
+        if self.reads is not None and n:
+            self.reads.take(n)
+
+    def mutation(self):
+        if self.mutations is not None:
+            self.mutations.take()
+
+    def done_reading(self, fd):
+        """Drops the cached pages of a file that was read completely, if configured."""
+        if self.drop_cache:
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                pass
+
+
+throttle = Throttle()
+
+
+def configure_worker(read_limit, open_limit, mutation_limit, drop_cache, share):
+    """Initializer of hashing worker processes, which have their own copy of 'throttle'."""
+    throttle.configure(read_limit, open_limit, mutation_limit, drop_cache, share)
+
+
+def parse_size(value):
+    """Parses a number with an optional K, M or G suffix (powers of 1024), e.g. '50M'."""
+    value = str(value).strip()
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    if value[-1:].lower() in units:
+        return int(float(value[:-1]) * units[value[-1].lower()])
+    return int(float(value))
+
+
+IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+IOPRIO_SET_SYSCALLS = {"x86_64": 251, "i386": 289, "i686": 289, "aarch64": 30, "armv7l": 314,
+                       "ppc64le": 273, "s390x": 282, "riscv64": 30}
+
+
+def ioprio_value(ioprio):
+    """Returns the ioprio_set() value of a setting such as 'best-effort:7', or None for 'none'.
+
+    Raises ValueError for an unknown class or a level outside 0-7.
+    """
+    if not ioprio or ioprio.lower() == "none":
+        return None
+    name, _, level = ioprio.lower().partition(":")
+    if name not in IOPRIO_CLASSES:
+        raise ValueError("unknown I/O priority class " + repr(name))
+    level = int(level) if level else 4 if name != "idle" else 0
+    if not 0 <= level <= 7:
+        raise ValueError("I/O priority level must be 0-7")
+    return (IOPRIO_CLASSES[name] << 13) | level
+
+
+def parse_ioprio(value):
+    """Checks an I/O priority setting for argparse and returns it in lower case."""
+    ioprio_value(value)
+    return value.lower()
+
+
+def set_priority(nice=0, ioprio=None):
+    """Lowers the CPU priority by 'nice' and sets the I/O priority ('idle', 'best-effort[:N]', 'realtime:N')."""
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError as e:
+            reporter.error(None, "Error setting nice value:", e)
+    try:
+        value = ioprio_value(ioprio)
+    except ValueError as e:
+        reporter.error(None, "Invalid ioprio setting:", ioprio, "-", e)
+        return
+    if value is None:
+        return
+    number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if number is None or not platform.system() == "Linux":
+        reporter.error(None, "I/O priorities are not supported on this platform; ignoring ioprio")
+        return
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if libc.syscall(number, 1, 0, value) < 0:  # IOPRIO_WHO_PROCESS, this process
+        reporter.error(None, "Error setting I/O priority:", os.strerror(ctypes.get_errno()))
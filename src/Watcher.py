@@ -0,0 +1,225 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from Reporter import reporter
+
+
+class Inotify:
+    """Minimal ctypes binding of the Linux inotify API."""
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        try:
+            libc = ctypes.CDLL(libc_name, use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            init = libc.inotify_init1
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform") from None
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = init(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+    @staticmethod
+    def _raise(path=None):
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e), path)
+
+    def add_watch(self, path, mask):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise(path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Waits up to 'timeout' seconds and returns a list of (wd, mask, cookie, name) events."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """Keeps an inventory in sync with inotify events and yields the files that changed."""
+    MASK = (Inotify.IN_MODIFY | Inotify.IN_ATTRIB | Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_FROM
+            | Inotify.IN_MOVED_TO | Inotify.IN_CREATE | Inotify.IN_DELETE | Inotify.IN_ONLYDIR)
+
+    def __init__(self, directories, inventory, debounce=2.0):
+        self.directories = directories
+        self.inventory = inventory
+        self.debounce = debounce
+        self.inotify = Inotify()
+        self.paths = {}
+        self.wds = {}
+        self.pending = {}
+        self.new_dirs = []
+        self.overflow = False
+
+    def watch_tree(self, top):
+        """Watches 'top' and every directory below it."""
+        inventory = self.inventory
+        device = None
+        if inventory.one_file_system:
+            try:
+                device = os.stat(top).st_dev
+            except OSError:
+                return
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            try:
+                wd = self.inotify.add_watch(path, self.MASK)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    reporter.error("watch", "Error: inotify watch limit reached; raise fs.inotify.max_user_watches")
+                elif e.errno != errno.ENOENT:
+                    reporter.error("watch", "Error watching directory", path, e)
+                continue
+            self.paths[wd] = path
+            self.wds[path] = wd
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if not entry.is_dir(follow_symlinks=False) or inventory.excluded(path, entry.name):
+                            continue
+                        if device is not None and entry.stat(follow_symlinks=False).st_dev != device:
+                            continue
+                        stack.append(entry.path)
+            except OSError:
+                pass
+
+    def unwatch_tree(self, top):
+        """Stops watching 'top' and the directories below it."""
+        prefix = top.rstrip(os.sep) + os.sep
+        for path in [p for p in self.wds if p == top or p.startswith(prefix)]:
+            wd = self.wds.pop(path)
+            self.paths.pop(wd, None)
+            self.inotify.rm_watch(wd)
+
+    def unwatch_all(self):
+        for wd in list(self.paths):
+            self.inotify.rm_watch(wd)
+        self.paths.clear()
+        self.wds.clear()
+
+    def handle(self, wd, mask, name):
+        """Applies one event to the watch table, the inventory and the pending files."""
+        if mask & Inotify.IN_Q_OVERFLOW:
+            self.overflow = True
+            return
+        root = self.paths.get(wd)
+        if root is None:
+            return
+        if mask & Inotify.IN_IGNORED:
+            self.paths.pop(wd, None)
+            self.wds.pop(root, None)
+            return
+        path = os.path.join(root, name)
+        if mask & Inotify.IN_ISDIR:
+            if mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+                if not self.inventory.excluded(root, name):
+                    self.new_dirs.append(path)
+            elif mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+                self.unwatch_tree(path)
+                self.inventory.forget_tree(path)
+            return
+        if mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+            self.pending.pop((root, name), None)
+            self.inventory.forget_tree(root, name)
+        else:
+            self.pending[(root, name)] = time.monotonic()
+
+    def add_new_dirs(self):
+        """Watches the directories created since the last call and marks their files as pending."""
+        now = time.monotonic()
+        while self.new_dirs:
+            top = self.new_dirs.pop()
+            self.watch_tree(top)
+            for root, dirs, names in os.walk(top):
+                dirs[:] = [d for d in dirs if not self.inventory.excluded(root, d)]
+                for name in names:
+                    self.pending[(root, name)] = now
+
+    def take_ready(self):
+        """Removes and returns the pending (root, name) pairs that have been quiet long enough."""
+        limit = time.monotonic() - self.debounce
+        ready = [key for key, last in self.pending.items() if last <= limit]
+        for key in ready:
+            del self.pending[key]
+        return ready
+
+    def batches(self):
+        """Yields the records of every settled batch of changed files, or None after a full rescan."""
+        for top in self.directories:
+            self.watch_tree(top)
+        reporter.info("Watching", len(self.wds), "directories for changes")
+        reporter.flush()
+        try:
+            while True:
+                if self.new_dirs:
+                    timeout = 0
+                elif self.pending:
+                    timeout = max(0.0, min(self.pending.values()) + self.debounce - time.monotonic())
+                else:
+                    timeout = None
+                for wd, mask, _, name in self.inotify.read(timeout):
+                    self.handle(wd, mask, name)
+                if self.overflow:
+                    reporter.info("\nEvent queue overflow: rescanning", " ".join(self.directories))
+                    self.overflow = False
+                    self.pending.clear()
+                    self.new_dirs = []
+                    self.unwatch_all()
+                    for top in self.directories:
+                        self.watch_tree(top)
+                    self.inventory.rescan()
+                    yield None
+                    continue
+                self.add_new_dirs()
+                records = []
+                for root, name in sorted(self.take_ready()):
+                    record = self.inventory.update(root, name)
+                    if record is not None:
+                        records.append(record)
+                if records:
+                    yield records
+        finally:
+            self.inotify.close()
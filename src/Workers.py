@@ -0,0 +1,41 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from Reporter import reporter
+
+
+def make_executor(jobs, kind="thread", initializer=None, initargs=()):
+    """Returns a pool with 'jobs' workers of the given kind ('thread' or 'process'), or None for serial work."""
+    if jobs is None or jobs <= 1:
+        return None
+    if kind == "process":
+        try:
+            return ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs)
+        except (ImportError, NotImplementedError, OSError) as e:
+            reporter.error(None, "Process pool unavailable, using threads:", e)
+    return ThreadPoolExecutor(max_workers=jobs)
+
+
+def guarded(fn, *args):
+    """Returns (fn(*args), None), or (None, the exception) if the call failed.
+
+    Lets workers hand errors back to the caller, which reports them in order.
+    """
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, e
+
+
+def bounded_map(executor, fn, arg_tuples, window):
+    """Yields fn(*args) for every tuple in 'arg_tuples', in input order, with at most 'window' calls in flight."""
+    if executor is None:
+        for args in arg_tuples:
+            yield fn(*args)
+        return
+    pending = deque()
+    for args in arg_tuples:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, *args))
+    while pending:
+        yield pending.popleft().result()
@@ -1,6 +1,11 @@
 import os
+import re
 from FileCleaner import FileCleaner
+from Matcher import build_matchers
+from Permissions import PermissionRules
 from Parser import ArgParser
+from Reporter import reporter
+from Throttle import parse_size, set_priority, throttle
 
 
 class CleanerState:
@@ -9,6 +14,7 @@ class CleanerState:
         self.always_delete = False
         self.always_chmod = False
         self.always_rename = False
+        self.always_link = False
 
 
 def read_config():
@@ -16,9 +22,41 @@ def read_config():
     config_path = ".clean_files"
     config = {
         "desired_mode": "rw-r--r--",
+        "permission_rules": [],
         "problematic_chars": ":\".;*?$#'|\\",
         "substitute_char": ".",
-        "temp_extensions": [".tmp", "~"]
+        "temp_extensions": [".tmp", "~"],
+        "temp_patterns": [],
+        "temp_regexes": [],
+        "hash_buffer_size": 1048576,
+        "partial_hash_size": 16384,
+        "hash_algorithm": "blake2b",
+        "compare_max_group": 3,
+        "duplicate_action": "delete",
+        "hash_cache": ".clean_files_cache",
+        "hash_cache_max_age": 30,
+        "jobs": 1,
+        "hash_executor": "thread",
+        "hash_memory_limit": 268435456,
+        "plan_file": "clean_files.plan.jsonl",
+        "scan_workers": 1,
+        "scan_sorted": False,
+        "scan_queue_size": 1024,
+        "snapshot": ".clean_files_snapshot",
+        "group_memory_limit": 536870912,
+        "spill_dir": None,
+        "watch_debounce": 2.0,
+        "one_file_system": False,
+        "symlinks": "skip",
+        "exclude": [],
+        "report_format": "human",
+        "report_batch_size": 512,
+        "read_limit": 0,
+        "open_limit": 0,
+        "mutation_limit": 0,
+        "drop_cache": False,
+        "nice": 0,
+        "ioprio": "none"
     }
     if os.path.exists(config_path):
         try:
@@ -33,14 +71,93 @@ def read_config():
                         value = value.strip()
                         if key == "desired_mode":
                             config["desired_mode"] = value
+                        elif key == "permission_rule":
+                            config["permission_rules"].append(value)
                         elif key == "problematic_chars":
                             config["problematic_chars"] = value
                         elif key == "substitute_char":
                             config["substitute_char"] = value
                         elif key == "temp_extensions":
                             config["temp_extensions"] = [ext.strip() for ext in value.split(",") if ext.strip()]
+                        elif key == "temp_patterns":
+                            config["temp_patterns"] = [p.strip() for p in value.split(",") if p.strip()]
+                        elif key == "temp_regex":
+                            config["temp_regexes"].append(value)
+                        elif key == "hash_buffer_size":
+                            config["hash_buffer_size"] = int(value)
+                        elif key == "partial_hash_size":
+                            config["partial_hash_size"] = int(value)
+                        elif key == "hash_algorithm":
+                            config["hash_algorithm"] = value.lower()
+                        elif key == "compare_max_group":
+                            config["compare_max_group"] = int(value)
+                        elif key == "duplicate_action":
+                            config["duplicate_action"] = value.lower()
+                        elif key == "hash_cache":
+                            config["hash_cache"] = value
+                        elif key == "hash_cache_max_age":
+                            config["hash_cache_max_age"] = int(value)
+                        elif key == "jobs":
+                            config["jobs"] = int(value)
+                        elif key == "hash_executor":
+                            config["hash_executor"] = value
+                        elif key == "hash_memory_limit":
+                            config["hash_memory_limit"] = int(value)
+                        elif key == "plan_file":
+                            config["plan_file"] = value
+                        elif key == "scan_workers":
+                            config["scan_workers"] = int(value)
+                        elif key == "scan_sorted":
+                            config["scan_sorted"] = value.lower() in ("1", "true", "yes")
+                        elif key == "scan_queue_size":
+                            config["scan_queue_size"] = int(value)
+                        elif key == "snapshot":
+                            config["snapshot"] = value
+                        elif key == "group_memory_limit":
+                            config["group_memory_limit"] = int(value)
+                        elif key == "spill_dir":
+                            config["spill_dir"] = value
+                        elif key == "watch_debounce":
+                            config["watch_debounce"] = float(value)
+                        elif key == "one_file_system":
+                            config["one_file_system"] = value.lower() in ("1", "true", "yes")
+                        elif key == "symlinks":
+                            config["symlinks"] = value.lower()
+                        elif key == "exclude":
+                            config["exclude"] = [p.strip() for p in value.split(",") if p.strip()]
+                        elif key == "report_format":
+                            config["report_format"] = value.lower()
+                        elif key == "report_batch_size":
+                            config["report_batch_size"] = int(value)
+                        elif key == "read_limit":
+                            config["read_limit"] = parse_size(value)
+                        elif key == "open_limit":
+                            config["open_limit"] = int(value)
+                        elif key == "mutation_limit":
+                            config["mutation_limit"] = int(value)
+                        elif key == "drop_cache":
+                            config["drop_cache"] = value.lower() in ("1", "true", "yes")
+                        elif key == "nice":
+                            config["nice"] = int(value)
+                        elif key == "ioprio":
+                            config["ioprio"] = value.lower()
         except Exception as e:
             print("Error reading configuration file:", e)
+    if config["report_format"] not in ("human", "jsonl", "csv"):
+        print("Invalid report_format setting:", config["report_format"], "- using human")
+        config["report_format"] = "human"
+    if config["symlinks"] not in ("skip", "follow", "file"):
+        print("Invalid symlinks setting:", config["symlinks"], "- using skip")
+        config["symlinks"] = "skip"
+    try:
+        build_matchers(config)
+    except re.error as e:
+        print("Error in temporary file patterns:", e)
+        config["temp_patterns"] = []
+        config["temp_regexes"] = []
+        build_matchers(config)
+    config["permission_policy"] = PermissionRules.parse(config["permission_rules"])
+    config["scan_dirs"] = config["permission_policy"].has_dir_rules
     return config
 
 
@@ -48,6 +165,56 @@ def main():
     arg_parser = ArgParser()
     args = arg_parser.parse()
     config = read_config()
+    config["rehash"] = args.rehash
+    config["assume_yes"] = args.yes
+    if args.link:
+        config["duplicate_action"] = "link"
+    if args.debounce is not None:
+        config["watch_debounce"] = args.debounce
+    if args.manifest is not None:
+        config["manifest"] = args.manifest
+    if args.plan_dir is not None:
+        config["plan_dir"] = args.plan_dir
+    if args.plan_file is not None:
+        config["plan_file"] = args.plan_file
+    if args.scan_workers is not None:
+        config["scan_workers"] = args.scan_workers
+    if args.sorted:
+        config["scan_sorted"] = True
+    config["incremental"] = args.incremental
+    config["stats"] = args.stats
+    config["stats_file"] = args.stats_file
+    config["profile"] = args.profile
+    config["profile_output"] = args.profile_output
+    config["reset_snapshot"] = args.reset_snapshot
+    if args.jobs is not None:
+        config["jobs"] = args.jobs
+    if args.executor is not None:
+        config["hash_executor"] = args.executor
+    if args.one_file_system:
+        config["one_file_system"] = True
+    if args.symlinks is not None:
+        config["symlinks"] = args.symlinks
+    if args.exclude:
+        config["exclude"] = config["exclude"] + args.exclude
+    if args.read_limit is not None:
+        config["read_limit"] = args.read_limit
+    if args.open_limit is not None:
+        config["open_limit"] = args.open_limit
+    if args.mutation_limit is not None:
+        config["mutation_limit"] = args.mutation_limit
+    if args.drop_cache:
+        config["drop_cache"] = True
+    if args.nice is not None:
+        config["nice"] = args.nice
+    if args.ioprio is not None:
+        config["ioprio"] = args.ioprio
+    if args.report is not None:
+        config["report_format"] = args.report
+    reporter.configure(config["report_format"], args.report_file, args.quiet, args.progress,
+                       config["report_batch_size"])
+    throttle.configure(config["read_limit"], config["open_limit"], config["mutation_limit"], config["drop_cache"])
+    set_priority(config["nice"], config["ioprio"])
     mode = args.mode if args.mode else 'all'
     cleaner = FileCleaner(args.directories, config, mode)
     cleaner.run()
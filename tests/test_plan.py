@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+CLEAN_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "clean_files.py")
+
+
+class PlanApplyTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "d")
+        os.mkdir(self.root)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def touch(self, name):
+        with open(os.path.join(self.root, name), "w") as f:
+            f.write("x")
+
+    def clean_files(self, *args):
+        result = subprocess.run([sys.executable, CLEAN_FILES] + list(args) + ["d", "--plan-file", "p.jsonl"],
+                                cwd=self.tmp.name, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def test_new_plan_is_not_resumed_from_old_journal(self):
+        self.touch("a.tmp")
+        self.clean_files("plan", "-y")
+        self.clean_files("apply", "-y")
+        self.assertFalse(os.path.exists(os.path.join(self.root, "a.tmp")))
+        self.touch("b.tmp")
+        self.clean_files("plan", "-y")
+        output = self.clean_files("apply", "-y")
+        self.assertNotIn("Resuming plan", output)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "b.tmp")))
+
+    def test_interrupted_apply_resumes(self):
+        self.touch("a.tmp")
+        self.clean_files("plan", "-y")
+        self.clean_files("apply", "-y")
+        output = self.clean_files("apply", "-y")
+        self.assertIn("Resuming plan: 1 action(s) already applied, 0 remaining", output)
+
+
+if __name__ == "__main__":
+    unittest.main()